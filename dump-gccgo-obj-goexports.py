@@ -4,65 +4,135 @@
 import getopt
 import os
 import re
+import struct
 import sys
-import tempfile
 
 import script_utils as u
 
 flag_infiles = []
 
 
+def read_elf_section(data, secname):
+  """Return contents of section 'secname' from ELF image 'data'.
+
+  Returns None if 'data' is not a well-formed ELF object, or an empty
+  string if the section is not present. This is done in-process as
+  opposed to running 'objcopy -O binary --only-section=...' into a temp
+  file and then reading the temp file back in.
+  """
+  if data[:4] != b"\x7fELF":
+    return None
+  endian = "<" if data[5] == 1 else ">"
+  try:
+    if data[4] == 2:
+      # ELFCLASS64
+      shoff, = struct.unpack_from(endian + "Q", data, 0x28)
+      shentsize, shnum, shstrndx = struct.unpack_from(endian + "HHH",
+                                                      data, 0x3A)
+      shfmt = endian + "II16xQQ"
+    else:
+      # ELFCLASS32
+      shoff, = struct.unpack_from(endian + "I", data, 0x20)
+      shentsize, shnum, shstrndx = struct.unpack_from(endian + "HHH",
+                                                      data, 0x2E)
+      shfmt = endian + "II8xII"
+    shdrs = [struct.unpack_from(shfmt, data, shoff + idx * shentsize)
+             for idx in range(shnum)]
+    stroff = shdrs[shstrndx][2]
+  except (struct.error, IndexError):
+    return None
+  want = secname.encode("utf-8")
+  for name, _, off, size in shdrs:
+    noff = stroff + name
+    if data[noff:data.find(b"\0", noff)] == want:
+      return data[off:off + size]
+  return b""
+
+
+# Archive magic string and member names that denote symbol tables
+# (GNU and BSD flavors) as opposed to real archive elements.
+ARMAG = b"!<arch>\n"
+SYMTAB_NAMES = ("/", "/SYM64", "__.SYMDEF", "__.SYMDEF SORTED")
+
+
+def first_archive_member(inf):
+  """Return (name, contents) for first object in archive, or None if error.
+
+  Walks the ar headers in-process (as opposed to running 'ar t' and
+  'ar x'); the file offset of 'inf' is assumed to be just past the
+  archive magic string.
+  """
+  longnames = b""
+  while True:
+    hdr = inf.read(60)
+    if len(hdr) < 60:
+      return None
+    name = hdr[0:16].rstrip()
+    try:
+      size = int(hdr[48:58])
+    except ValueError:
+      return None
+    body = inf.read(size)
+    if size % 2:
+      inf.read(1)
+    if name == b"//":
+      # GNU long name table
+      longnames = body
+      continue
+    if name.startswith(b"#1/") and name[3:].isdigit():
+      # BSD long name, stored at the start of the member data
+      nlen = int(name[3:])
+      name, body = body[:nlen].rstrip(b"\0"), body[nlen:]
+    elif name.startswith(b"/") and name[1:].isdigit():
+      # GNU long name, stored as offset into long name table
+      off = int(name[1:])
+      end = longnames.find(b"/\n", off)
+      if end == -1:
+        return None
+      name = longnames[off:end]
+    elif name.endswith(b"/") and name != b"/":
+      name = name[:-1]
+    sname = name.decode("utf-8", "replace")
+    if sname in SYMTAB_NAMES:
+      continue
+    return sname, body
+
+
 def examine(afile):
   """Dump go exports for specified file."""
 
   objfile = afile
-  arcmd = "ar t %s" % afile
-
-  # Run 'ar' command, suppressing error output. If
-  # if succeeds, then continue on the ar path, otherwise
-  # treat input as an object.
-  if u.doscmd(arcmd, True, True):
-    # Handle archives
-    lines = u.docmdlines(arcmd, True)
-    if not lines:
-      u.warning("skipping %s, can't index archive %s", afile)
-      return
-    # Extract elem from archive
-    elem = lines[0].strip()
-    u.verbose(1, "%s contains %s" % (afile, elem))
-    rc = u.docmdnf("ar x %s %s" % (afile, elem))
-    if rc:
-      u.warning("skipping %s, can't extract object" % afile)
-      return
-    objfile = elem
-
-  gexptemp = tempfile.NamedTemporaryFile(mode="w",
-                                         prefix="go_export",
-                                         delete=True)
+
+  # Check for archive magic; if present, pull the first element out
+  # of the archive directly (no 'ar t' / 'ar x' subprocesses and no
+  # extracted object on disk), otherwise treat input as an object.
+  try:
+    with open(afile, "rb") as inf:
+      data = inf.read(len(ARMAG))
+      if data == ARMAG:
+        member = first_archive_member(inf)
+        if not member:
+          u.warning("skipping %s, can't index archive" % afile)
+          return
+        objfile, data = member
+        u.verbose(1, "%s contains %s" % (afile, objfile))
+      else:
+        data += inf.read()
+  except IOError as e:
+    u.warning("skipping %s, unable to read: %s" % (afile, e.strerror))
+    return
 
   # Handle objects
-  cmd = ("objcopy -O binary --only-section=.go_export "
-         "--set-section-flags .go_export=alloc %s "
-         "%s" % (objfile, gexptemp.name))
-  rc = u.docmdnf(cmd)
-  if rc:
+  contents = read_elf_section(data, ".go_export")
+  if contents is None:
     u.warning("skipping %s, can't extract export "
-              "data (cmd failed: %s)" % (objfile, cmd))
+              "data (not an ELF object)" % objfile)
     return
-  try:
-    inf = open(gexptemp.name, "rb")
-  except IOError as e:
-    u.error("unable to open tempfile %s: "
-            "%s" % (gexptemp.name, e.strerror))
   print("== %s ==" % afile)
-  lines = inf.readlines()
+  lines = contents.decode("utf-8", "replace").splitlines()
   if not lines:
     u.warning("skipping %s, no .go_export section present" % objfile)
-  for line in lines:
-    print(line.strip())
-  inf.close()
-  if objfile != afile:
-    os.unlink(objfile)
+  sys.stdout.write("".join(line.strip() + "\n" for line in lines))
 
 
 def usage(msgarg):
@@ -92,11 +162,9 @@ def parse_args():
   for opt, _ in optlist:
     if opt == "-d":
       u.increment_verbosity()
-  for a in args:
-    if not os.path.exists(a):
-      u.warning("failed to open/access '%s' -- skipping" % a)
-    else:
-      flag_infiles.append(a)
+  # Note: no existence check here; examine() will report files
+  # that can't be opened.
+  flag_infiles.extend(args)
 
 
 # Setup
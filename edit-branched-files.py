@@ -28,7 +28,7 @@ flag_branchname = None
 def docmd(cmd):
   """Execute a command."""
   if flag_echo:
-    sys.stderr.write("executing: " + cmd + "\n")
+    sys.stderr.write("executing: %s\n" % cmd)
   if flag_dryrun:
     return
   u.docmd(cmd)
@@ -37,7 +37,7 @@ def docmd(cmd):
 def doscmd(cmd, nf=None):
   """Execute a command."""
   if flag_echo:
-    sys.stderr.write("executing: " + cmd + "\n")
+    sys.stderr.write("executing: %s\n" % cmd)
   if flag_dryrun:
     return
   u.doscmd(cmd, nf)
@@ -43,11 +43,28 @@ files_emitted = []
 # Look at git stash, not branch
 flag_dostash = False
 
+#......................................................................
+
+# Regular expressions to match:
+
+# ## mybranch...origin/master [ahead 3]
+brnreg = re.compile(r"^## (\S+)\.\.(\S+) \[ahead (\d+)\]\s*$")
+
+# ## mybranch...origin/master [ahead 3, behind 2]
+brnbehindreg = re.compile(r"^## (\S+)\.\.(\S+) "
+                          r"\[ahead (\d+), behind.+\]\s*$")
+
+# ca3b66ca8d4f1e2b3c4d5e6f7a8b9c0d1e2f3a4b ca3b66ca8d finalthing
+creg = re.compile(r"^(\S+) (\S+) (\S.+)$")
+
+# stash@{0}: WIP on master: 7fa195c1b9 unrelated
+streg = re.compile(r"^(stash@{\S+})\:\s.+$")
+
 
 def docmd(cmd):
   """Execute a command."""
   if flag_echo:
-    sys.stderr.write("executing: " + cmd + "\n")
+    sys.stderr.write("executing: %s\n" % cmd)
   if flag_dryrun:
     return
   u.docmd(cmd)
@@ -56,7 +73,7 @@ def docmd(cmd):
 def doscmd(cmd):
   """Execute a command."""
   if flag_echo:
-    sys.stderr.write("executing: " + cmd + "\n")
+    sys.stderr.write("executing: %s\n" % cmd)
   if flag_dryrun:
     return
   u.doscmd(cmd)
@@ -65,7 +82,7 @@ def doscmd(cmd):
 def docmdout(cmd, outfile):
   """Execute a command to an output file."""
   if flag_echo:
-    sys.stderr.write("executing: " + cmd + "\n")
+    sys.stderr.write("executing: %s\n" % cmd)
   if flag_dryrun:
     return
   u.docmdout(cmd, outfile)
@@ -80,7 +97,47 @@ def docmdinout(cmd, infile, outfile):
   u.docmdinout(cmd, infile, outfile)
 
 
-def process_commit(idx, flav, branchname, githash, comment):
+def collect_log_blocks(lines):
+  """Split output of 'git log --name-only' into per-commit blocks.
+
+  Returns a dict keyed by full commit hash; value is the list of
+  lines that 'git log --name-only -1 <hash>' would have produced.
+  """
+  blocks = {}
+  cur = None
+  for line in lines:
+    if line.startswith("commit "):
+      cur = []
+      blocks[line.split()[1]] = cur
+    if cur is not None:
+      cur.append(line)
+  for cur in blocks.values():
+    while cur and not cur[-1]:
+      cur.pop()
+  return blocks
+
+
+def commit_has_no_changes(loglines):
+  """Return True if 'git log --name-only' block lists no files.
+
+  Merge commits are never treated as empty, since 'git log' doesn't
+  list their files but they can still have a diff against parent 1.
+  """
+  if not loglines:
+    return False
+  body = False
+  for line in loglines:
+    if not body:
+      if line.startswith("Merge:"):
+        return False
+      body = not line
+      continue
+    if line and not line.startswith("    "):
+      return False
+  return True
+
+
+def process_commit(idx, flav, branchname, githash, comment, loglines=None):
   """Process a commit by hash."""
   global files_emitted
   tag = ""
@@ -100,26 +157,27 @@ def process_commit(idx, flav, branchname, githash, comment):
     outf.write("// comment: %s\n" % comment)
     outf.write("//\n")
   if flav != "stash":
-    lines = u.docmdlines("git log --name-only -1 %s" % githash)
-    if not lines:
-      u.error("empty output from 'git log --name-only -1 %s'" % githash)
-    for line in lines:
+    if not loglines:
+      u.error("no 'git log --name-only' output for %s" % githash)
+    for line in loglines:
       outf.write(line)
       outf.write("\n")
     outf.write("--------------------------------------------------------------\n")
   else:
     outf.write("Stash entry: %s\n" % githash)
-  lines = u.docmdlines("git diff %s^ %s" % (githash, githash))
-  if not lines:
-    u.error("empty output from 'git diff %s^ %s'" % (githash, githash))
-  for line in lines:
-    outf.write(line)
-    outf.write("\n")
+  if flav != "stash" and commit_has_no_changes(loglines):
+    # No files touched, so no need to run 'git diff'.
+    u.verbose(1, "no files changed in %s, skipping diff" % githash)
+    outf.close()
+    return
+  # Send diff output straight to the file, as opposed to
+  # collecting it into a list of lines first.
+  u.docmdtofile("git diff %s^ %s" % (githash, githash), outf)
+  u.verbose(1, "wrote %d bytes to %s" % (outf.tell(), fn))
   outf.close()
-  u.verbose(1, "wrote %d diff lines to %s" % (len(lines), fn))
 
 
-def emit_index_file(flav):
+def emit_index_file(flav, loglines=None):
   """Emit index to emitted files."""
   global files_emitted
   n = len(files_emitted) + 1
@@ -131,7 +189,7 @@ def emit_index_file(flav):
   outf.write("Files emitted:\n\n%s\n" % " ".join(files_emitted))
   if flav != "stash":
     outf.write("\n\nLog:\n\n")
-    lines = u.docmdlines("git log --name-only -%d HEAD" % len(files_emitted))
+    lines = loglines if files_emitted else []
     for line in lines:
       outf.write(line)
       outf.write("\n")
@@ -145,7 +203,6 @@ def perform_on_stash():
   if not lines:
     u.warning("no stash entries found, leaving now.")
     return
-  streg = re.compile(r"^(stash@{\S+})\:\s.+$")
   idx = 0
   for line in lines:
     idx += 1
@@ -167,37 +224,44 @@ def perform():
   lines = u.docmdlines("git status -sb")
   if not lines:
     u.error("empty output from git status -sb")
-  brnreg = re.compile(r"^## (\S+)\.\.(\S+) \[ahead (\d+)\]\s*$")
   m = brnreg.match(lines[0])
   if not m:
-    brnreg = re.compile(r"^## (\S+)\.\.(\S+) \[ahead (\d+), behind.+\]\s*$")
-    m = brnreg.match(lines[0])
+    m = brnbehindreg.match(lines[0])
   if not m:
     u.error("can't pattern match output of git status -sb: %s" % lines[0])
   branchname = m.group(1).strip(".")
   commits = int(m.group(3))
   u.verbose(1, "branch is: %s commits: %d" % (branchname, commits))
 
-  # Grab info on commits
-  lines = u.docmdlines("git log --oneline -%d" % commits)
+  # Grab info on commits, oldest first
+  lines = u.docmdlines("git log --reverse "
+                       "--format='%%H %%h %%s' -%d" % commits)
   if not lines:
-    u.error("empty output from 'git log --oneline'")
+    u.error("empty output from 'git log --reverse'")
+
+  # Collect file lists for all commits with a single 'git log'
+  loglines = u.docmdlines("git log --name-only -%d HEAD" % commits)
+  if not loglines:
+    u.error("empty output from 'git log --name-only -%d HEAD'" % commits)
+  logblocks = collect_log_blocks(loglines)
 
   # Process commits in reverse order
-  creg = re.compile(r"^(\S+) (\S.+)$")
-  lines.reverse()
   idx = 0
   for cl in lines:
     idx += 1
     m = creg.match(cl)
     if not m:
       u.error("can't pattern match git log output: %s" % cl)
-    githash = m.group(1)
-    comment = m.group(2)
+    fullhash = m.group(1)
+    githash = m.group(2)
+    comment = m.group(3)
     u.verbose(1, "processing hash %s comment %s" % (githash, comment))
-    process_commit(idx, "branch", branchname, githash, comment)
+    commitlog = logblocks.get(fullhash)
+    if not commitlog:
+      u.error("no 'git log --name-only' output for %s" % githash)
+    process_commit(idx, "branch", branchname, githash, comment, commitlog)
 
-  emit_index_file("branch=%s" % branchname)
+  emit_index_file("branch=%s" % branchname, loglines)
 
 
 def usage(msgarg):
@@ -31,10 +31,14 @@ that a module dump mentions all functions).
 
 """
 
-from collections import defaultdict
+from array import array
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 import getopt
+import mmap
 import os
 import re
+import shutil
 import sys
 
 import script_utils as u
@@ -45,10 +49,21 @@ flag_dryrun = False
 # Echo commands mode
 flag_echo = False
 
+# Use mmap-based scanner as opposed to reading line by line
+flag_mmap = False
+
+# Number of threads used to write out dumps (mmap mode)
+flag_writers = 1
+
 # Input file, output dir
 flag_infile = None
 flag_outdir = None
 
+# Thread pool for writing dumps, if any, and writes not yet known to
+# have completed (oldest first).
+writer = None
+pendingwrites = deque()
+
 # Passes, functions
 passes = {}
 functions = {}
@@ -62,8 +77,9 @@ dumps = defaultdict(int)
 # Complete listing of dump files in chronological order.
 alldumps = []
 
-# Keyed by function, value is a list of indices into the alldumps array.
-funcdumps = defaultdict(list)
+# Keyed by function, value is an array of indices into the alldumps array
+# (stored as compact C ints rather than a list of Python ints).
+funcdumps = defaultdict(lambda: array("i"))
 
 
 def docmd(cmd):
@@ -85,30 +101,25 @@ def dochdir(thedir):
     u.error("chdir failed: %s" % err)
 
 
+def find_debris(subdir, flavs):
+  """Yield paths of non-directories below subdir ending with one of flavs."""
+  with os.scandir(subdir) as it:
+    for entry in it:
+      if entry.is_dir(follow_symlinks=False):
+        yield from find_debris(entry.path, flavs)
+      elif entry.name.endswith(flavs):
+        yield entry.path
+
+
 def do_clean(subdir):
   """Clean this libgo dir."""
   flavs = (".o", "gox", ".a", ".so", ".lo", ".la")
-  here = os.getcwd()
-  dochdir(subdir)
   if flag_dryrun:
     u.verbose(0, "... cleaning %s" % subdir)
   else:
-    cmd = "find . -depth "
-    first = True
-    for item in flavs:
-      if not first:
-        cmd += " -o "
-      first = False
-      cmd += "-name '*%s' -print" % item
-    lines = u.docmdlines(cmd)
-    lines.reverse()
-    debris = lines
-    for d in debris:
-      if not d:
-        continue
+    for d in find_debris(subdir, flavs):
       u.verbose(1, "toclean '%s'" % d)
       os.unlink(d)
-  dochdir(here)
 
 
 def sanitize_pass(passname):
@@ -121,11 +132,8 @@ def sanitize_pass(passname):
   return passname
 
 
-def emitdump(passname, funcname, looplab, lines):
-  """Emit single dump for module/pass or fn/pass."""
-  u.verbose(2, "emitdump(%s,%s,%s,lines=%d)" % (passname, funcname, looplab, len(lines)))
-  if not lines:
-    return
+def newdump(passname, funcname, looplab):
+  """Allocate name for next dump of module/pass or fn/pass."""
   tag = funcname
   if not funcname:
     tag = "__module__"
@@ -135,117 +143,301 @@ def emitdump(passname, funcname, looplab, lines):
     dump = "%s:%s" % (tag, passname)
   dumpver = dumps[dump]
   dumps[dump] += 1
-  dumpname = "%s:%d" % (dump, dumpver)
-  ofname = os.path.join(flag_outdir, dumpname)
-  try:
-    with open(ofname, "w") as wf:
-      for line in lines:
-        wf.write(line)
-  except IOError:
-    u.error("open failed for %s" % ofname)
-  u.verbose(1, "emitted dump %d of %d "
-            "lines to %s" % (dumpver, len(lines), ofname))
-  # book-keeping
+  return "%s:%d" % (dump, dumpver), dumpver
+
+
+def recorddump(dumpname, funcname):
+  """Book-keeping for newly emitted dump."""
   dumpidx = len(alldumps)
   alldumps.append(dumpname)
   if funcname:
     funcdumps[funcname].append(dumpidx)
+
+
+def emitdump(passname, funcname, looplab, data):
+  """Emit single dump for module/pass or fn/pass from raw bytes."""
+  u.verbose(2, "emitdump(%s,%s,%s,bytes=%d)" % (passname, funcname, looplab, len(data)))
+  if not data:
+    return
+  dumpname, dumpver = newdump(passname, funcname, looplab)
+  ofname = os.path.join(flag_outdir, dumpname)
+  if writer:
+    # Hand off to the pool so that the next dump can be scanned while
+    # this one is being written. Cap the number in flight so that
+    # queued dumps don't pile up in memory.
+    pendingwrites.append(writer.submit(writedump, ofname, data))
+    if len(pendingwrites) > 16 * flag_writers:
+      finishwrite(pendingwrites.popleft())
+  else:
+    try:
+      writedump(ofname, data)
+    except IOError:
+      u.error("open failed for %s" % ofname)
+  u.verbose(1, "emitted dump %d of %d "
+            "bytes to %s" % (dumpver, len(data), ofname))
+  recorddump(dumpname, funcname)
+  return dumpname
+
+
+def writedump(ofname, data):
+  """Write raw bytes of dump to file ofname."""
+  with open(ofname, "wb") as wf:
+    wf.write(data)
+
+
+def finishwrite(future):
+  """Wait for a dump write submitted to the pool, checking for errors."""
+  try:
+    future.result()
+  except IOError as e:
+    u.error("open failed for %s" % e.filename)
+
+
+def emitspool(passname, funcname, looplab, spool):
+  """Emit single dump that was spooled to a temp file by process().
+
+  Here spool is a list [temp file, line count, emitted file]. The first
+  emit renames the temp file into place; should the same dump be
+  emitted again, the copy is made from the previously emitted file.
+  """
+  tmpname, nlines, prevname = spool
+  u.verbose(2, "emitspool(%s,%s,%s,lines=%d)" % (passname, funcname, looplab, nlines))
+  if not nlines:
+    return
+  dumpname, dumpver = newdump(passname, funcname, looplab)
+  ofname = os.path.join(flag_outdir, dumpname)
+  try:
+    if prevname:
+      shutil.copyfile(prevname, ofname)
+    else:
+      os.replace(tmpname, ofname)
+  except OSError as ose:
+    u.error("unable to emit %s: %s" % (ofname, ose))
+  spool[2] = ofname
+  u.verbose(1, "emitted dump %d of %d "
+            "lines to %s" % (dumpver, nlines, ofname))
+  recorddump(dumpname, funcname)
   return dumpname
 
 
+def retirespool(spool):
+  """Remove temp file for spooled dump if it was never emitted."""
+  if spool and not spool[2]:
+    os.unlink(spool[0])
+
+
+def openspool(tmpname):
+  """Open temp file to spool the lines of a dump into."""
+  try:
+    return open(tmpname, "w", buffering=1024*1024)
+  except IOError:
+    u.error("open failed for %s" % tmpname)
+
+
 def process(rf):
   """Read lines from input file."""
 
   # Note: dumps are emitted lazily, e.g. we read through all of dump K
-  # and into dump K+1 before emitting dump K.
-
-  lnum = 0
-  dumpre = re.compile(r"^\*\*\* IR Dump Before (\S.+)\s+\*\*\*\s*")
-  fnre = re.compile(r"^define\s\S.+\s\@(\S+)\(.+\).+\{\s*$")
-  modre = re.compile(r"^target datalayout =.*$")
-  loopre = re.compile(r"^\; Preheader\:\s*$")
+  # and into dump K+1 before emitting dump K. Rather than holding the
+  # lines of dump K in memory until then, they are written out to a
+  # temp file in the output dir as they are read, and the temp file is
+  # renamed to the final dump name once that name is known.
+
+  # Single regex to detect dump headers, function definitions, module
+  # dumps and loop dumps, so that we only run one match per line.
+  # Dispatch is on the name of the group that matched.
+  hdrre = re.compile(r"^(?:\*\*\* IR Dump Before "
+                     r"(?P<passname>\S.+)\s+\*\*\*"
+                     r"|define\s\S.+\s\@(?P<fname>\S+)\(.+\).+\{\s*$"
+                     r"|(?P<mod>target datalayout =)"
+                     r"|(?P<loop>\; Preheader\:)\s*$)")
+  # Literal prefixes for the above, checked before running the regex
+  # (most lines are IR instructions that can't match).
+  hdrprefixes = ("*** IR Dump Before ", "define", "target datalayout =",
+                 "; Preheader:")
   labre = re.compile(r"^(\S+)\:.*$")
 
   # Info on previous dump
   curpass = None
   curfunc = None
   curloop = None
-  curdumplines = []
+  curspool = None
 
   # Current dump flavor: one of 'module', 'function', 'loop', or 'unknown'
   dumpflavor = "unknown"
-  # Lines in current dump
-  dumplines = []
+  # Temp file receiving lines of current dump, and its line count.
+  # Lines preceding the first dump header are never emitted.
+  spoolnames = [os.path.join(flag_outdir, ".spool%d" % i) for i in (0, 1)]
+  spoolidx = 0
+  dumpwf = None
+  dumplines = 0
   # State information on the current loop.
   passname = None
   looplabel = None
 
-  while True:
-    lnum += 1
-    line = rf.readline()
-    if not line:
-      break
+  # Checked once up front, so that the trace messages below aren't
+  # formatted (and then discarded) when not running with -d.
+  verb = u.verbosity_level() > 0
+
+  for lnum, line in enumerate(rf, start=1):
+    mhdr = None
+    if line.startswith(hdrprefixes):
+      mhdr = hdrre.match(line)
+    which = mhdr.lastgroup if mhdr else None
     if dumpflavor == "unknown":
-      mloop = loopre.match(line)
-      if mloop:
+      if which == "loop":
         # Emit previous dump
         if curpass:
-          emitdump(curpass, curfunc, curloop, curdumplines)
+          emitspool(curpass, curfunc, curloop, curspool)
         # This is a loop dump. Note: keep curfunc.
         dumpflavor = "loop"
-        u.verbose(1, "line %d: now in loop dump "
-                  "for fn %s pass %s" % (lnum, curfunc, curpass))
-      mmod = modre.match(line)
-      if mmod:
+        if verb:
+          u.verbose(1, "line %d: now in loop dump "
+                    "for fn %s pass %s" % (lnum, curfunc, curpass))
+      elif which == "mod":
         # Emit previous dump
         if curpass:
-          emitdump(curpass, curfunc, curloop, curdumplines)
+          emitspool(curpass, curfunc, curloop, curspool)
         # This is a module dump. Discard func.
         dumpflavor = "module"
         curfunc = None
-        u.verbose(1, "line %d: now in module dump "
-                  "for pass %s" % (lnum, curpass))
-      mfn = fnre.match(line)
-      if mfn:
+        if verb:
+          u.verbose(1, "line %d: now in module dump "
+                    "for pass %s" % (lnum, curpass))
+      elif which == "fname":
         # Emit previous dump.
         if curpass:
-          emitdump(curpass, curfunc, curloop, curdumplines)
-        curfunc = mfn.group(1)
+          emitspool(curpass, curfunc, curloop, curspool)
+        curfunc = mhdr.group("fname")
         functions[curfunc] = 1
-        u.verbose(1, "line %d: now in fn %s" % (lnum, curfunc))
+        if verb:
+          u.verbose(1, "line %d: now in fn %s" % (lnum, curfunc))
     if dumpflavor == "loop" and not looplabel:
       mlab = labre.match(line)
       if mlab:
         looplabel = mlab.group(1)
         loops[looplabel] = 1
-        u.verbose(1, "line %d: loop label is %s" % (lnum, looplabel))
-    mdmp = dumpre.match(line)
-    if mdmp:
+        if verb:
+          u.verbose(1, "line %d: loop label is %s" % (lnum, looplabel))
+    if which == "passname":
       curpass = passname
       curloop = looplabel
-      if curloop:
+      if verb and curloop:
         u.verbose(1, "line %d: curloop now %s" % (lnum, curloop))
       looplabel = None
-      passname = sanitize_pass(mdmp.group(1))
-      u.verbose(1, "line %d: passname is %s" % (lnum, passname))
-      curdumplines = dumplines
-      dumplines = []
+      passname = sanitize_pass(mhdr.group("passname"))
+      if verb:
+        u.verbose(1, "line %d: passname is %s" % (lnum, passname))
+      if dumpwf:
+        dumpwf.close()
+        retirespool(curspool)
+        curspool = [dumpwf.name, dumplines, None]
+      dumpwf = openspool(spoolnames[spoolidx])
+      spoolidx ^= 1
+      dumplines = 0
       passes[passname] = 1
       dumpflavor = "unknown"
-    dumplines.append(line)
+    if dumpwf:
+      dumpwf.write(line)
+      dumplines += 1
+  if dumpwf:
+    dumpwf.close()
+    os.unlink(dumpwf.name)
+  # emit final dump
+  if curpass:
+    emitspool(curpass, curfunc, curloop, curspool)
+  retirespool(curspool)
+
+
+def process_mmap(rf):
+  """Memory-map input file and split it into dumps by header.
+
+  This produces the same dumps as process(), but locates dump headers
+  with mmap.find() and scans each dump with regex searches over the
+  mapped bytes, as opposed to running the per-line state machine.
+  Each dump is written out as a raw slice of the mapping, without
+  being decoded to text first.
+  """
+
+  # Note: same lazy emission scheme as in process() above.
+
+  hdrsep = b"\n*** IR Dump Before "
+  dumpre = re.compile(rb"\*\*\* IR Dump Before (\S.+)\s+\*\*\*")
+  trigre = re.compile(rb"^(?:(\; Preheader\:[^\S\n]*)$"
+                      rb"|(target datalayout =)"
+                      rb"|define[^\S\n]\S.+[^\S\n]\@(\S+)\(.+\).+\{[^\S\n]*$)",
+                      re.M)
+  labre = re.compile(rb"^(\S+)\:", re.M)
+
+  # Info on previous dump
+  curpass = None
+  curfunc = None
+  curloop = None
+  curdump = None
+
+  # State information on the current loop.
+  passname = None
+  looplabel = None
+
+  # Collect offsets of dump headers, plus EOF as final boundary.
+  mm = mmap.mmap(rf.fileno(), 0, access=mmap.ACCESS_READ)
+  size = len(mm)
+  hdroffsets = []
+  if mm[:len(hdrsep) - 1] == hdrsep[1:]:
+    hdroffsets.append(0)
+  pos = mm.find(hdrsep)
+  while pos != -1:
+    hdroffsets.append(pos + 1)
+    pos = mm.find(hdrsep, pos + 1)
+  headers = []
+  for pos in hdroffsets:
+    eol = mm.find(b"\n", pos)
+    mhdr = dumpre.match(mm, pos, size if eol == -1 else eol)
+    if mhdr:
+      headers.append((pos, mhdr))
+  headers.append((size, None))
+
+  start = 0
+  for end, mhdr in headers:
+    # Scan for start-of-dump triggers while the flavor is unknown.
+    for mtrig in trigre.finditer(mm, start, end):
+      if curpass:
+        emitdump(curpass, curfunc, curloop, mm[curdump])
+      if mtrig.lastindex == 1:
+        # This is a loop dump. Note: keep curfunc.
+        mlab = labre.search(mm, mtrig.start(), end)
+        if mlab:
+          looplabel = mlab.group(1).decode("utf-8")
+          loops[looplabel] = 1
+        break
+      if mtrig.lastindex == 2:
+        # This is a module dump. Discard func.
+        curfunc = None
+        break
+      curfunc = mtrig.group(3).decode("utf-8")
+      functions[curfunc] = 1
+    if mhdr:
+      curpass = passname
+      curloop = looplabel
+      looplabel = None
+      passname = sanitize_pass(mhdr.group(1).decode("utf-8"))
+      u.verbose(1, "offset %d: passname is %s" % (end, passname))
+      curdump = slice(start, end)
+      passes[passname] = 1
+    start = end
   # emit final dump
   if curpass:
-    emitdump(curpass, curfunc, curloop, curdumplines)
+    emitdump(curpass, curfunc, curloop, mm[curdump])
+  mm.close()
 
 
 def emitstats():
   """Emit stats and index."""
   indname = os.path.join(flag_outdir, "index.txt")
-  totaldumps = 0
-  for _, v in dumps.items():
-    totaldumps += v
+  # Each emitted dump is recorded in alldumps, so no need to
+  # total up the per-name counters here.
   u.verbose(0, "... captured %d total dumps, %d functions, "
-            "%d loops, %d passes" % (totaldumps, len(functions),
+            "%d loops, %d passes" % (len(alldumps), len(functions),
                                      len(loops), len(passes)))
   try:
     with open(indname, "w") as wf:
@@ -263,9 +455,23 @@ def emitstats():
 
 def perform():
   """Top level driver routine."""
+  global writer
+
   try:
-    with open(flag_infile, "r") as rf:
-      process(rf)
+    if flag_mmap:
+      if flag_writers > 1:
+        writer = ThreadPoolExecutor(max_workers=flag_writers)
+      with open(flag_infile, "rb") as rf:
+        if os.fstat(rf.fileno()).st_size:
+          process_mmap(rf)
+      while pendingwrites:
+        finishwrite(pendingwrites.popleft())
+      if writer:
+        writer.shutdown()
+    else:
+      # Use a large read buffer; dumps can be many gigabytes.
+      with open(flag_infile, "r", buffering=4*1024*1024) as rf:
+        process(rf)
   except IOError:
     u.error("open failed for %s" % flag_infile)
   emitstats()
@@ -283,6 +489,9 @@ def usage(msgarg):
     -d    increase debug msg verbosity level
     -o X  write dumps to dir X
     -D    dryrun mode (echo commands but do not execute)
+    -m    memory-map input file and split on dump headers
+          (faster for very large dumps)
+    -j N  with -m, use N threads to write out dumps
 
     """ % me)
   sys.exit(1)
@@ -290,10 +499,11 @@ def usage(msgarg):
 
 def parse_args():
   """Command line argument parsing."""
-  global flag_dryrun, flag_echo, flag_outdir, flag_infile
+  global flag_dryrun, flag_echo, flag_outdir, flag_infile, flag_mmap
+  global flag_writers
 
   try:
-    optlist, args = getopt.getopt(sys.argv[1:], "deo:i:D")
+    optlist, args = getopt.getopt(sys.argv[1:], "deo:i:Dmj:")
   except getopt.GetoptError as err:
     # unrecognized option
     usage(str(err))
@@ -307,6 +517,10 @@ def parse_args():
       flag_echo = True
     elif opt == "-D":
       flag_dryrun = True
+    elif opt == "-m":
+      flag_mmap = True
+    elif opt == "-j":
+      flag_writers = int(arg)
     elif opt == "-o":
       flag_outdir = arg
       if not os.path.exists(flag_outdir):
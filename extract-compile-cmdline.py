@@ -43,46 +43,80 @@ flag_target = None
 # Experimental compile-in-parallel feature
 flag_parfactor = 0
 
-# Compile cmd line args to skip. Key is arg, val is skip count.
-args_to_skip = {"-o": 1, "-MD": 0, "-MF": 1, "-fdiagnostics-color": 0}
+# Compile cmd line args to skip, along with the arg that follows.
+args_to_skip_with_next = frozenset(("-o", "-MF"))
+
+# Compile cmd line args to skip (just the arg itself).
+args_to_skip = frozenset(("-MD", "-fdiagnostics-color"))
+
+#......................................................................
+
+# Regular expressions to match:
+
+# Lines that mention a prebuilt gcc or clang
+regfcg = re.compile(r"^.+\s+(prebuilts\/(?:gcc|clang)\S+)\s.+$")
+
+# ... (PWD=/proc/self/cwd prebuilts/clang/.../clang -c foo.c ) && (...)
+reg1 = re.compile(r"^.+PWD=\S+\s+(prebuilts\/\S+)\s+(.+)\)\s+\&\&\s+\(.+$")
+
+# Prebuilt gcc/clang lines that are not compiles (strip, ar, link).
+# Single alternation, so one scan of the line covers all four cases.
+skipre = re.compile(r".(?:\-android.*\-strip |Wl,\-soname|"
+                    r"Wl,\-\-build\-id=md5|\-android\-ar ).")
+
+# Host and target output paths
+matchhost = re.compile(r"^.*out\/host\/.+$")
+matchtarget = re.compile(r"^.*out/target/.+$")
+
+# Source file
+msrc = re.compile(r"^\S+\.[Ccp]+$")
+
+# Tail end of $(cat X) clause
+rei = re.compile(r"^(.+)\)$")
+
+# Whitespace-separated token (using the same whitespace set as shlex)
+tokre = re.compile(r"[^ \t\r\n]+")
 
 
 def mktempname(salt, instance):
   """Create /tmp file name for compile output."""
   m = hashlib.md5()
-  m.update(salt)
+  m.update(salt.encode("utf-8"))
   hd = m.hexdigest()
   return "/tmp/%s.%d.err.txt" % (hd, instance)
 
 
+def excluded_by_path(arg):
+  """Return True if arg is a host/target path we're excluding."""
+  if flag_exclude_target and matchtarget.match(arg):
+    u.verbose(2, "excluding compile (target match on %s)" % arg)
+    return True
+  if flag_exclude_host and matchhost.match(arg):
+    u.verbose(2, "excluding compile (host match on %s)" % arg)
+    return True
+  return False
+
+
 def perform_extract(inf, outf):
   """Read inf and extract compile cmd to outf."""
   global driver_count
-  regfg = re.compile(r"^.+\s+(prebuilts\/gcc\S+)\s.+$")
-  regfc = re.compile(r"^.+\s+(prebuilts\/clang\S+)\s.+$")
-  reg1 = re.compile(r"^.+PWD=\S+\s+(prebuilts\/\S+)\s+(.+)\)\s+\&\&\s+\(.+$")
   preamble_emitted = False
   count = 0
   tempfiles = []
   srcfiles_encountered = {}
-  while True:
-    line = inf.readline()
-    if not line:
-      break
+  for line in inf:
+    # Cheap substring check first; most lines don't mention prebuilts.
+    if "prebuilts/" not in line:
+      continue
     u.verbose(2, "line is %s" % line.strip())
-    mc = regfc.match(line)
-    mg = regfg.match(line)
-    if not mc and not mg:
+    if not regfcg.match(line):
       continue
 
     # This should pluck out the compiler invocation
     mi = reg1.match(line)
     if not mi:
       # Skip strip, ar, etc
-      if (not re.compile(r"^.+\-android.*\-strip .+$").match(line) and
-          not re.compile(r"^.+Wl,\-soname.+$").match(line) and
-          not re.compile(r"^.+Wl,\-\-build\-id=md5.+$").match(line) and
-          not re.compile(r"^.+\-android\-ar .+$").match(line)):
+      if not skipre.search(line):
         u.warning("line refers to prebuilt gcc/clang but fails "
                   "pattern match: %s" % line.strip())
       continue
@@ -101,54 +135,54 @@ def perform_extract(inf, outf):
       drivers[driver] = driver_var
       driver_count += 1
 
-    matchhost = re.compile("^.*out\/host\/.+$")
-    matchtarget = re.compile("^.*out/target/.+$")
-
     # Now filter the args. Pick out -MD, -MF, -o, etc so as to leave us
     # with the raw compile cmd that is more manageable.
     exclude = False
     args = []
-    skipcount = 0
-    raw_args = shlex.split(argstring)
+    # Full shell-style tokenizing is only needed if there is quoting;
+    # otherwise splitting on whitespace gives the same result.
+    if "\"" in argstring or "'" in argstring or "\\" in argstring:
+      raw_args = shlex.split(argstring)
+    else:
+      raw_args = tokre.findall(argstring)
     numraw = len(raw_args)
     incfile = None
-    msrc = re.compile(r"^\S+\.[Ccp]+$")
-    for idx in range(0, numraw):
+    idx = 0
+    while idx < numraw:
       arg = raw_args[idx]
-      if flag_exclude_target and matchtarget.match(arg):
-        u.verbose(2, "excluding compile (target match on %s)" % arg)
-        exclude = True
-      if flag_exclude_host and matchhost.match(arg):
-        u.verbose(2, "excluding compile (host match on %s)" % arg)
+      idx += 1
+      if excluded_by_path(arg):
         exclude = True
-      if skipcount:
+      if arg in args_to_skip:
         u.verbose(2, "skipping arg: %s" % arg)
-        skipcount -= 1
         continue
-      if arg in args_to_skip:
-        sk = args_to_skip[arg]
-        if idx + sk >= numraw:
+      if arg in args_to_skip_with_next:
+        if idx >= numraw:
           u.error("at argument %s (pos %d): unable to skip"
-                  "ahead %d, not enough args (line: "
-                  "%s" % (arg, idx, sk, " ".join(raw_args)))
-        skipcount = sk
-        u.verbose(2, "skipping arg: %s (skipcount set to %d)" % (arg, sk))
+                  "ahead 1, not enough args (line: "
+                  "%s" % (arg, idx - 1, " ".join(raw_args)))
+        nextarg = raw_args[idx]
+        idx += 1
+        if excluded_by_path(nextarg):
+          exclude = True
+        u.verbose(2, "skipping args: %s %s" % (arg, nextarg))
         continue
       if arg == "$(cat":
         if incfile:
           u.error("internal error: multiple $cat( clauses")
-        incfile = raw_args[idx+1]
-        rei = re.compile(r"^(.+)\)$")
+        incfile = raw_args[idx]
+        idx += 1
+        if excluded_by_path(incfile):
+          exclude = True
         mei = rei.match(incfile)
         if not mei:
           u.error("internal error: malformed $cat clause: arg %s" % incfile)
         incfile = mei.group(1)
-        skipcount = 1
-        u.verbose(2, "skipping arg: %s (skipcount set to 1)" % arg)
+        u.verbose(2, "skipping args: %s %s" % (arg, incfile))
         args.append("$INC")
         continue
-      if flag_target and arg == "-target" and raw_args[idx+1] != flag_target:
-        u.verbose(2, "excluding compile (target %s not selected)" % raw_args[idx+1])
+      if flag_target and arg == "-target" and raw_args[idx] != flag_target:
+        u.verbose(2, "excluding compile (target %s not selected)" % raw_args[idx])
         exclude = True
       args.append(arg)
     if not exclude and flag_unique:
@@ -196,13 +230,14 @@ def perform():
   outf = sys.stdout
   if flag_infile:
     try:
-      inf = open(flag_infile, "rb")
+      inf = open(flag_infile, "r", buffering=1<<20,
+                 encoding="utf-8", errors="replace")
     except IOError as e:
       u.error("unable to open input file %s: "
               "%s" % (flag_infile, e.strerror))
   if flag_outfile:
     try:
-      outf = open(flag_outfile, "wb")
+      outf = open(flag_outfile, "w", buffering=1<<20)
     except IOError as e:
       u.error("unable to open output file %s: "
               "%s" % (flag_outfile, e.strerror))
@@ -16,12 +16,14 @@ u.setdeflanglocale()
 
 match1 = re.compile(r"^\[\d.+\]\s+0x\S+\s(.*)$")
 
-# Read
+# Read all input, then emit filtered lines with a single writelines call
 lines = sys.stdin.readlines()
+out = []
 for line in lines:
-  res1 = match1.match(line)
+  # Cheap literal check first; only timestamped lines need the regex.
+  res1 = line.startswith("[") and match1.match(line)
   if res1:
-    rem = res1.group(1)
-    sys.stdout.write("%s\n" % rem)
+    out.append(res1.group(1) + "\n")
     continue
-  sys.stdout.write(line)
+  out.append(line)
+sys.stdout.writelines(out)
@@ -6,7 +6,6 @@ screen out things that could cause problems with "ctags".
 
 """
 
-import re
 import sys
 
 import script_utils as u
@@ -15,16 +14,15 @@ import script_utils as u
 # Setup
 u.setdeflanglocale()
 
-match1 = re.compile(r"^.*[^\s]+\s+[^\s]+.*$")
-match2 = re.compile(r"^.*[\'\"]+.*$")
-
-# Read
+# Read all input, then emit filtered lines with a single writelines call
 lines = sys.stdin.readlines()
+out = []
 for line in lines:
-  res1 = match1.match(line)
-  if res1:
+  # Embedded whitespace: more than one token once leading/trailing
+  # whitespace is discounted.
+  if len(line.split(None, 1)) > 1:
     continue
-  res2 = match2.match(line)
-  if res2:
+  if "'" in line or "\"" in line:
     continue
-  sys.stdout.write(line)
+  out.append(line)
+sys.stdout.writelines(out)
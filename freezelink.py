@@ -3,6 +3,7 @@
 
 import getopt
 import os
+import shutil
 import sys
 
 import script_utils as u
@@ -68,14 +69,15 @@ for link in flag_infiles:
     continue
   u.verbose(1, "copying %s to %s" % (targ, link))
   try:
-    os.rename(bn, "%s.todel" % bn)
+    os.replace(bn, "%s.todel" % bn)
   except OSError as ose:
     u.warning("unable to process '%s' -- %s" % (link, ose))
     continue
-  nf = u.docmdnf("cp %s %s" % (targ, bn))
-  if nf != 0:
-    u.warning("copy failed, link reverted")
-    os.rename("%s.todel" % bn, bn)
+  try:
+    shutil.copy2(targ, bn)
+  except OSError as ose:
+    u.warning("copy failed (%s), link reverted" % ose)
+    os.replace("%s.todel" % bn, bn)
     continue
   u.verbose(1, "removing intermediate %s.todel" % bn)
   os.unlink("%s.todel" % bn)
@@ -11,8 +11,12 @@ options, and then run the build steps.
 """
 
 import getopt
+import multiprocessing
 import os
 import re
+import shlex
+import shutil
+import subprocess
 import sys
 
 import script_utils as u
@@ -30,8 +34,11 @@ flag_show_output = False
 # target architecture to build (ex: aarch64-linux-android)
 flag_target_arch = None
 
-# paralellism degree
-flag_parfactor = "-j40"
+# paralellism degree (if unset, derived from number of CPUs)
+flag_parfactor = None
+
+# make load average limit (ex: "-l32"), if any
+flag_loadavg = ""
 
 # do only gcc build
 flag_do_only_gcc_build = False
@@ -68,6 +75,9 @@ gcc_version = None
 # build debuggable gcc
 flag_debug_gcc = False
 
+# compile host tools (binutils, gcc) via ccache
+flag_use_ccache = False
+
 # Android sysroot needed
 flag_need_android_sysroot = False
 
@@ -89,6 +99,10 @@ gcc_build_dir = "build-gcc"
 # glibc build dir
 glibc_build_dir = "build-glibc"
 
+# gcc prereq tarballs (gmp, mpfr, etc) saved here for reuse by later
+# builds, e.g. from a freshly unpacked gcc source tree
+prereq_cache_dir = os.path.join(here, ".gcc-prereqs")
+
 # binutils git remote (if we're using trunk)
 binutils_git = "git://sourceware.org/git/binutils-gdb.git"
 
@@ -107,6 +121,22 @@ glibc_version = "2.20"
 # kernel version
 kernel_version = "linux-3.17.2"
 
+# Where source tarballs are downloaded from
+binutils_url = "http://ftpmirror.gnu.org/binutils/%s.tar.bz2"
+glibc_url = "http://ftpmirror.gnu.org/glibc/%s.tar.bz2"
+kernel_url = "https://www.kernel.org/pub/linux/kernel/v3.x/%s.tar.xz"
+
+
+# Name of top-level gcc source dir, ex: "gcc-4.9.2"
+gccsubdirre = re.compile(r"^gcc-.+$")
+
+# Line in gmp configure script that needs patching
+m4re = re.compile(r"^\s+M4=m4\-not\-needed\s*$")
+
+# Tarball or URL setting in gcc's contrib/download_prerequisites,
+# ex: "gmp='gmp-6.1.0.tar.bz2'"
+prereqre = re.compile(r"^(gmp|mpfr|mpc|isl|base_url)='(\S+)'\s*$")
+
 
 def docmd(cmd):
   """Execute a command."""
@@ -141,6 +171,18 @@ def dochdir(thedir):
     u.error("chdir failed: %s" % err)
 
 
+def domkdir(thedir):
+  """Create dir (if not already present)."""
+  if flag_echo:
+    sys.stderr.write("mkdir -p " + thedir + "\n")
+  if flag_dryrun:
+    return
+  try:
+    os.makedirs(thedir, exist_ok=True)
+  except OSError as err:
+    u.error("mkdir failed: %s" % err)
+
+
 def set_evar(var, val):
   """Set an environment variable prior to script execution."""
   os.environ[var] = val
@@ -151,11 +193,10 @@ def locate_gcc_subdir():
   """Find the gcc subdir in this dir."""
   global flag_gcc_subdir, gcc_version
   if not flag_gcc_subdir:
-    matcher = re.compile(r"^gcc-.+$")
     found = None
     subgcc = None
     for filename in os.listdir("."):
-      m = matcher.match(filename)
+      m = gccsubdirre.match(filename)
       if not m:
         continue
       if os.path.isdir(filename):
@@ -173,10 +214,9 @@ def locate_gcc_subdir():
   subver = os.path.join(os.path.join(flag_gcc_subdir, "gcc"), "BASE-VER")
   try:
     with open(subver, "r") as f:
-      lines = f.readlines()
+      gcc_version = f.readline().strip()
   except IOError:
     u.error("open failed for %s" % subver)
-  gcc_version = lines[0].strip()
   u.verbose(1, "gcc version appears to be %s" % gcc_version)
 
 
@@ -188,18 +228,19 @@ def setup_binutils():
   if binutils_version:
     binutils_subdir = "binutils-%s" % binutils_version
     if not os.path.exists(binutils_subdir):
-      docmd("wget http://ftpmirror.gnu.org/binutils/"
-            "%s.tar.bz2" % binutils_subdir)
+      # Reuse tarball left over from previous run, if any.
+      if not os.path.exists("%s.tar.bz2" % binutils_subdir):
+        docmd("wget %s" % (binutils_url % binutils_subdir))
       docmd("tar jxf %s.tar.bz2" % binutils_subdir)
   else:
     if not os.path.exists(binutils_subdir):
       doscmd("git clone --depth 1 %s binutils" % binutils_git)
   # Configure binutils
-  if not os.path.exists(binutils_build_dir):
-    docmd("mkdir %s" % binutils_build_dir)
+  domkdir(binutils_build_dir)
   dochdir(binutils_build_dir)
-  doscmd("../%s/configure --prefix=%s --target=%s "
+  doscmd("../%s/configure %s --prefix=%s --target=%s "
          "%s " % (binutils_subdir,
+                  mk_ccache_configopts(),
                   cross_prefix,
                   flag_target_arch,
                   flag_use_multilib))
@@ -208,10 +249,34 @@ def setup_binutils():
   dochdir("..")
 
 
+def setup_ccache():
+  """Set up ccache environment, if ccache requested."""
+  if not flag_use_ccache:
+    return
+  if not shutil.which("ccache"):
+    u.error("-c specified but ccache not found in PATH")
+  set_evar("CCACHE_DIR", os.path.join(here, ".ccache"))
+  set_evar("CCACHE_COMPRESS", "1")
+  # Don't let __DATE__/__TIME__ uses or header mtimes defeat caching.
+  set_evar("CCACHE_SLOPPINESS",
+           "time_macros,file_macro,include_file_mtime")
+
+
+def mk_ccache_configopts():
+  """Configure opts to build host tools with ccache.
+
+  Only used for binutils and gcc; glibc is compiled with the
+  cross compiler, so its CC setting has to be left alone.
+  """
+  if not flag_use_ccache:
+    return ""
+  return ("CC=\"ccache gcc\" CXX=\"ccache g++\" "
+          "CC_FOR_BUILD=\"ccache gcc\" CXX_FOR_BUILD=\"ccache g++\"")
+
+
 def setup_cross():
   """Create cross dir if needed and add to path."""
-  if not os.path.exists(cross_prefix):
-    docmd("mkdir %s" % cross_prefix)
+  domkdir(cross_prefix)
   epath = os.environ["PATH"]
   set_evar("PATH", "%s/bin:%s" % (cross_prefix, epath))
 
@@ -221,35 +286,106 @@ def patch_gmp_configure():
   if not flag_dryrun:
     try:
       with open("gmp/configure", "r") as rf:
-        lines = rf.readlines()
-      try:
-        with open("gmp/configure.hacked", "w") as wf:
-          matcher = re.compile(r"^\s+M4=m4\-not\-needed\s*$")
-          for line in lines:
-            m = matcher.match(line)
-            if m:
-              wf.write("  echo M4=m4-not-needed\n")
-            else:
-              wf.write(line)
-          wf.close()
-          docmd("mv gmp/configure gmp/configure.orig")
-          docmd("mv gmp/configure.hacked gmp/configure")
-          docmd("chmod 0755 gmp/configure")
-      except IOError:
-        u.error("open failed for gmp/configure.hacked")
+        try:
+          with open("gmp/configure.hacked", "w") as wf:
+            for line in rf:
+              if m4re.match(line):
+                wf.write("  echo M4=m4-not-needed\n")
+              else:
+                wf.write(line)
+        except IOError:
+          u.error("open failed for gmp/configure.hacked")
     except IOError:
       u.error("open failed for gmp/configure")
+    os.replace("gmp/configure", "gmp/configure.orig")
+    os.replace("gmp/configure.hacked", "gmp/configure")
+    os.chmod("gmp/configure", 0o755)
   else:
     u.verbose(0, "<applying gmp configure hack>")
 
 
+def read_prereq_settings():
+  """Return (base_url, tarballs) from contrib/download_prerequisites.
+
+  Run from gcc subdir. Older versions of the script don't have the
+  settings we look for here, in which case return (None, []).
+  """
+  settings = {}
+  try:
+    with open("contrib/download_prerequisites", "r") as rf:
+      for line in rf:
+        m = prereqre.match(line)
+        if m:
+          settings[m.group(1)] = m.group(2)
+  except IOError:
+    return None, []
+  base_url = settings.pop("base_url", None)
+  if not base_url:
+    return None, []
+  return base_url, sorted(settings.values())
+
+
+def prefetch_prereqs(base_url, tarballs):
+  """Fetch gcc prereq tarballs ahead of time (run from gcc subdir).
+
+  The contrib/download_prerequisites script downloads the tarballs one
+  after another, but skips those already present. So beforehand we
+  symlink in any tarballs saved in the prereq cache by previous runs,
+  and download the rest concurrently.
+  """
+  cmds = {}
+  for tarball in tarballs:
+    if os.path.exists(tarball):
+      continue
+    cached = os.path.join(prereq_cache_dir, tarball)
+    if os.path.exists(cached):
+      u.verbose(1, "using cached %s" % cached)
+      if not flag_dryrun:
+        os.symlink(cached, tarball)
+      continue
+    cmds[tarball] = "wget --no-verbose -O %s %s%s" % (tarball,
+                                                       base_url, tarball)
+  if flag_echo:
+    for cmd in cmds.values():
+      sys.stderr.write("executing: " + cmd + "\n")
+  if flag_dryrun:
+    return
+  out = None if flag_show_output else subprocess.DEVNULL
+  procs = [(tarball, subprocess.Popen(shlex.split(cmd),
+                                      stdout=out, stderr=out))
+           for tarball, cmd in cmds.items()]
+  for tarball, proc in procs:
+    if proc.wait() != 0:
+      # Remove partial download; download_prerequisites will retry.
+      u.warning("download of %s failed" % tarball)
+      if os.path.exists(tarball):
+        os.unlink(tarball)
+
+
+def cache_prereqs(tarballs):
+  """Save newly downloaded prereq tarballs in the prereq cache."""
+  if flag_dryrun:
+    return
+  for tarball in tarballs:
+    if os.path.islink(tarball) or not os.path.exists(tarball):
+      continue
+    cached = os.path.join(prereq_cache_dir, tarball)
+    if not os.path.exists(cached):
+      u.verbose(1, "caching %s" % cached)
+      os.makedirs(prereq_cache_dir, exist_ok=True)
+      shutil.copy2(tarball, cached)
+
+
 def setup_prereqs():
   """Set up gcc prereqs."""
   # Run the contrib download script -- easier that way
   gmp = os.path.join(flag_gcc_subdir, "gmp")
   if not os.path.exists(gmp):
     dochdir(flag_gcc_subdir)
+    base_url, tarballs = read_prereq_settings()
+    prefetch_prereqs(base_url, tarballs)
     docmd("./contrib/download_prerequisites")
+    cache_prereqs(tarballs)
     # Hack -- fix up gmp dir
     patch_gmp_configure()
     dochdir("..")
@@ -265,8 +401,7 @@ def mk_debug_configopts():
 
 def setup_gcc():
   """Configure and build gcc."""
-  if not os.path.exists(gcc_build_dir):
-    docmd("mkdir %s" % gcc_build_dir)
+  domkdir(gcc_build_dir)
   dochdir(gcc_build_dir)
   dopt = ""
   if flag_debug_gcc:
@@ -279,10 +414,10 @@ def setup_gcc():
       sropt = ""
     else:
       sropt = "--with-glibc-version=2.20"
-  doscmd("../%s/configure %s --prefix=%s --target=%s %s "
+  doscmd("../%s/configure %s %s --prefix=%s --target=%s %s "
          "--enable-languages=%s --enable-libgo "
          "%s %s " % (flag_gcc_subdir,
-                     dopt, cross_prefix,
+                     dopt, mk_ccache_configopts(), cross_prefix,
                      flag_target_arch,
                      sropt, flag_langs,
                      flag_use_multilib, flag_use_bootstrap))
@@ -294,8 +429,8 @@ def setup_gcc():
 def setup_kernel_headers():
   """Download and install kernel headers."""
   if not os.path.exists(kernel_version):
-    doscmd("wget https://www.kernel.org/pub/linux/"
-           "kernel/v3.x/%s.tar.xz" % kernel_version)
+    if not os.path.exists("%s.tar.xz" % kernel_version):
+      doscmd("wget %s" % (kernel_url % kernel_version))
     docmd("tar xJf %s.tar.xz" % kernel_version)
   dochdir(kernel_version)
   archname = legal_arches[flag_target_arch]
@@ -306,12 +441,11 @@ def setup_kernel_headers():
 
 def setup_glibc():
   """Configure and build glibc."""
-  if not os.path.exists(glibc_build_dir):
-    docmd("mkdir %s" % glibc_build_dir)
+  domkdir(glibc_build_dir)
   glibc_subdir = "glibc-%s" % glibc_version
   if not os.path.exists(glibc_subdir):
-    docmd("wget http://ftpmirror.gnu.org/glibc/"
-          "%s.tar.bz2" % glibc_subdir)
+    if not os.path.exists("%s.tar.bz2" % glibc_subdir):
+      docmd("wget %s" % (glibc_url % glibc_subdir))
     docmd("tar jxf %s.tar.bz2" % glibc_subdir)
   ta = flag_target_arch
   dochdir(glibc_build_dir)
@@ -332,6 +466,44 @@ def setup_glibc():
   dochdir("..")
 
 
+def prefetch_sources():
+  """Download all needed source tarballs with a single wget.
+
+  One wget run fetching several URLs can reuse its connection to
+  a given server, as opposed to one wget per tarball. The setup_*
+  routines skip their own download if the tarball is already here,
+  and retry it (failing the build if need be) if it is not.
+  """
+  tarballs = [(kernel_version, "%s.tar.xz" % kernel_version, kernel_url),
+              ("glibc-%s" % glibc_version,
+               "glibc-%s.tar.bz2" % glibc_version, glibc_url)]
+  if binutils_version:
+    bd = "binutils-%s" % binutils_version
+    tarballs.append((bd, "%s.tar.bz2" % bd, binutils_url))
+  fetches = []
+  for subdir, tarball, url in tarballs:
+    if not os.path.exists(subdir) and not os.path.exists(tarball):
+      fetches.append((tarball, url % subdir))
+  if not fetches:
+    return
+  cmd = "wget %s" % " ".join(url for _, url in fetches)
+  if flag_echo:
+    sys.stderr.write("executing: " + cmd + "\n")
+  if flag_dryrun:
+    return
+  out = None if flag_show_output else subprocess.DEVNULL
+  if subprocess.call(shlex.split(cmd), stdout=out, stderr=out) == 0:
+    return
+  # Find out which download(s) failed. 'wget -c' resumes a partial
+  # download and is a no-op for a complete one.
+  for tarball, url in fetches:
+    rc = subprocess.call(["wget", "-c", url], stdout=out, stderr=out)
+    if rc != 0:
+      u.warning("download of %s failed (rc=%d)" % (url, rc))
+      if os.path.exists(tarball):
+        os.unlink(tarball)
+
+
 def setup_sysroot():
   """Set up target root environment for android compiler builds."""
   global sysroot
@@ -344,19 +516,57 @@ def setup_sysroot():
   u.verbose(1, "setting sysroot to %s" % sysroot)
 
 
+def run_in_parallel(funcs):
+  """Run the specified setup routines concurrently.
+
+  Each routine runs in a forked child process as opposed to a thread,
+  since the routines do their work by chdir'ing into subdirs, and the
+  current dir is per-process state.
+  """
+  ctx = multiprocessing.get_context("fork")
+  sys.stdout.flush()
+  sys.stderr.flush()
+  procs = []
+  for f in funcs:
+    p = ctx.Process(target=f, name=f.__name__)
+    p.start()
+    procs.append(p)
+  failed = []
+  for p in procs:
+    p.join()
+    if p.exitcode != 0:
+      failed.append(p.name)
+  if failed:
+    u.error("setup failed in: %s" % " ".join(failed))
+
+
 def perform():
   """Main guts of script."""
+  global flag_parfactor
   others = not flag_do_only_gcc_build
   locate_gcc_subdir()
   setup_cross()
+  setup_ccache()
   if others:
-    setup_kernel_headers()
-    setup_binutils()
-    setup_prereqs()
+    prefetch_sources()
+    # These are independent of one another (gcc needs all three).
+    # Keep dry runs serial so that the echoed commands read in order.
+    steps = [setup_kernel_headers, setup_binutils, setup_prereqs]
+    if flag_dryrun:
+      for step in steps:
+        step()
+    else:
+      # The steps' makes share the machine, so unless told otherwise
+      # (-l), hold off on new jobs once the load reaches the CPU count.
+      serial_parfactor = flag_parfactor
+      if flag_parfactor and not flag_loadavg:
+        flag_parfactor = "%s -l%d" % (flag_parfactor, os.cpu_count() or 4)
+      run_in_parallel(steps)
+      flag_parfactor = serial_parfactor
   setup_sysroot()
   setup_gcc()
   if others:
-    setup_kernel_headers()
+    # Kernel headers were installed above; no need to redo that here.
     setup_glibc()
 
 
@@ -380,7 +590,11 @@ def usage(msgarg):
     -B    build only gcc, don't build other bits
     -Y    enable bootstrap
     -n    no parallelism in build
+    -j N  run N jobs in parallel for make (default: number of CPUs)
+    -l N  don't start new make jobs if load average is above N
+          (default while binutils etc build concurrently: number of CPUs)
     -C    build debuggable gcc
+    -c    compile binutils and gcc via ccache
     -M    pass --disable-multilib on configure
     -L Q  add language Q to enabled languages during configure step
     -N X  use sysroot derived from Android NDK at dir X (required for android targets)
@@ -403,10 +617,11 @@ def parse_args():
   global binutils_version, flag_parfactor, flag_do_only_gcc_build
   global flag_gcc_subdir, flag_debug_gcc, flag_langs
   global flag_need_android_sysroot, flag_ndk_dir
-  global flag_use_multilib, flag_use_bootstrap
+  global flag_use_multilib, flag_use_bootstrap, flag_use_ccache
+  global flag_loadavg
 
   try:
-    optlist, args = getopt.getopt(sys.argv[1:], "hdnest:b:N:DBMYCL:")
+    optlist, args = getopt.getopt(sys.argv[1:], "hdnest:b:j:l:N:DBMYCcL:")
   except getopt.GetoptError as err:
     # unrecognized option
     usage(str(err))
@@ -428,6 +643,10 @@ def parse_args():
       flag_use_bootstrap = ""
     elif opt == "-n":
       flag_parfactor = ""
+    elif opt == "-j":
+      flag_parfactor = "-j%d" % int(arg)
+    elif opt == "-l":
+      flag_loadavg = "-l%d" % int(arg)
     elif opt == "-b":
       u.verbose(0, "setting binutils version to %s" % arg)
       binutils_version = arg
@@ -437,6 +656,8 @@ def parse_args():
       flag_ndk_dir = arg
     elif opt == "-C":
       flag_debug_gcc = True
+    elif opt == "-c":
+      flag_use_ccache = True
     elif opt == "-S":
       u.verbose(0, "setting gcc_subdir to %s" % arg)
       flag_gcc_subdir = arg
@@ -456,6 +677,10 @@ def parse_args():
     usage("unknown extra args")
   if not flag_target_arch:
     usage("select a target architecture")
+  if flag_parfactor is None:
+    flag_parfactor = "-j%d" % (os.cpu_count() or 4)
+  if flag_parfactor and flag_loadavg:
+    flag_parfactor = "%s %s" % (flag_parfactor, flag_loadavg)
 
   matcher = re.compile(r"^.*android.*$")
   m = matcher.match(flag_target_arch)
@@ -15,56 +15,81 @@ flag_num_classes = 500
 flag_class_prefix = None
 flag_file_prefix = None
 
+# Code emitted per class into generated.cc; "hd" is the class's md5
+# hex digest repeated 10x, "h0" its first digit, and "h1".."h4" its
+# 8-digit chunks.
+cc_template = """\
+%(kl)s::%(kl)s(int x)  : x_(x + 0x%(h1)s), y_(x ^ 0x%(h3)s)
+{ }
+int %(kl)s::flarbit(int y) {
+  static const int vec%(h1)s[1024*16] = {4,5,6};
+  int t%(hd)s = (x_ ^ y) + 0x%(h2)s ;
+  x_ = t%(hd)s + vec%(h1)s[y&0x1fff] ;
+  int z%(hd)s = (y_ ^ (x_ - y)) - 0x%(h4)s ;
+  y_ = z%(hd)s ;
+  return y_ + (x_ << 0x%(h0)s) ;
+}
+"""
 
-def perform():
-  """Emit files."""
+# Code emitted per class into usegen.cc.
+usegen_template = """\
+int %(cp)suseit%(ii)d(int x) { 
+ int rv = 0;
+  %(cp)sKlass%(ii)d obj%(ii)d(x);
+  rv += obj%(ii)d.flarbit(x+%(jj)d);
+  return rv;
+}
+"""
+
+
+def generate(num_classes, class_prefix, file_prefix):
+  """Emit files for num_classes classes with the specified prefixes.
+
+  Also called directly by gencode_package.py.
+  """
   cp = ""
-  if flag_class_prefix:
-    cp = "%s_" % flag_class_prefix
+  if class_prefix:
+    cp = "%s_" % class_prefix
   fp = ""
-  if flag_file_prefix:
-    fp = "%s_" % flag_file_prefix
-  f = open("%sgenerated.h" % fp, "w")
-  for ii in range(flag_num_classes):
-    f.write("class %sKlass%d {\n" % (cp, ii))
-    f.write("  private:\n")
-    f.write("    int x_, y_;\n")
-    f.write("  public:\n")
-    f.write("    %sKlass%d(int x);\n" % (cp, ii))
-    f.write("    virtual ~%sKlass%d() { }\n" % (cp, ii))
-    f.write("    virtual int flarbit(int y);\n")
-    f.write("};\n\n")
-  f.close()
-
-  f = open("%sgenerated.cc" % fp, "w")
-  f.write("#include \"%sgenerated.h\"\n" % fp)
-  for ii in range(flag_num_classes):
-    m = hashlib.md5()
-    m.update("%s%sKlass%d" % (fp, cp, ii))
-    hd = m.hexdigest() * 10
-    f.write("%sKlass%d::%sKlass%d(int x) " % (cp, ii, cp, ii))
-    f.write(" : x_(x + 0x%s), y_(x ^ 0x%s)\n" % (hd[0:8], hd[16:24]))
-    f.write("{ }\n")
-    f.write("int %sKlass%d::flarbit(int y) {\n" % (cp, ii))
-    f.write("  static const int vec%s[1024*16] = {4,5,6};\n" % hd[0:8])
-    f.write("  int t%s = (x_ ^ y) + 0x%s ;\n" % (hd, hd[8:16]))
-    f.write("  x_ = t%s + vec%s[y&0x1fff] ;\n" % (hd, hd[0:8]))
-    f.write("  int z%s = (y_ ^ (x_ - y)) - 0x%s ;\n" % (hd, hd[24:32]))
-    f.write("  y_ = z%s ;\n" % hd)
-    f.write("  return y_ + (x_ << 0x%s) ;\n" % hd[0])
-    f.write("}\n")
-  f.close()
-
-  f = open("%susegen.cc" % fp, "w")
-  f.write("#include \"%sgenerated.h\"\n" % fp)
-  for ii in range(flag_num_classes):
-    f.write("int %suseit%d(int x) { \n" % (cp, ii))
-    f.write(" int rv = 0;\n")
-    f.write("  %sKlass%d obj%d(x);\n" % (cp, ii, ii))
-    f.write("  rv += obj%d.flarbit(x+%d);\n" % (ii, (ii*2+3)))
-    f.write("  return rv;\n")
-    f.write("}\n")
-  f.close()
+  if file_prefix:
+    fp = "%s_" % file_prefix
+
+  # Each file's contents are collected into a list and then written
+  # out with a single write, as opposed to many small writes.
+  out = []
+  for ii in range(num_classes):
+    kl = "%sKlass%d" % (cp, ii)
+    out.append("class %s {\n"
+               "  private:\n"
+               "    int x_, y_;\n"
+               "  public:\n"
+               "    %s(int x);\n"
+               "    virtual ~%s() { }\n"
+               "    virtual int flarbit(int y);\n"
+               "};\n\n" % (kl, kl, kl))
+  with open("%sgenerated.h" % fp, "w") as f:
+    f.write("".join(out))
+
+  out = ["#include \"%sgenerated.h\"\n" % fp]
+  for ii in range(num_classes):
+    kl = "%sKlass%d" % (cp, ii)
+    hd = hashlib.md5(("%s%s" % (fp, kl)).encode("utf-8")).hexdigest()
+    out.append(cc_template % {"kl": kl, "hd": hd * 10, "h0": hd[0],
+                              "h1": hd[0:8], "h2": hd[8:16],
+                              "h3": hd[16:24], "h4": hd[24:32]})
+  with open("%sgenerated.cc" % fp, "w") as f:
+    f.write("".join(out))
+
+  out = ["#include \"%sgenerated.h\"\n" % fp]
+  for ii in range(num_classes):
+    out.append(usegen_template % {"cp": cp, "ii": ii, "jj": ii*2+3})
+  with open("%susegen.cc" % fp, "w") as f:
+    f.write("".join(out))
+
+
+def perform():
+  """Emit files."""
+  generate(flag_num_classes, flag_class_prefix, flag_file_prefix)
 
 
 def usage(msgarg):
@@ -107,9 +132,10 @@ def parse_args():
       flag_file_prefix = arg
 
 
-# Setup
-u.setdeflanglocale()
-parse_args()
+if __name__ == "__main__":
+  # Setup
+  u.setdeflanglocale()
+  parse_args()
 
-# Main guts
-perform()
+  # Main guts
+  perform()
@@ -4,9 +4,11 @@
 """
 
 import getopt
+import multiprocessing
 import os
 import sys
 
+import gencode_classes
 import script_utils as u
 
 # Classes per instance
@@ -22,7 +24,7 @@ def perform():
   mf = open("makefile.generated", "w")
 
   # divide instances into chunks by 10
-  chunks = flag_num_instances / 10
+  chunks = flag_num_instances // 10
   chunksize = 10
   jj = 0
   for ch in range(chunks):
@@ -67,10 +69,11 @@ def perform():
   mf.write("\nallobjs: $(OBJECTS)\n")
   mf.close()
 
-  # the source code
-  for ii in range(flag_num_instances):
-    u.docmd("gencode_classes.py -c %s -C i%d_ -F "
-            "i%d\n" % (flag_num_classes, ii, ii))
+  # the source code (instances are independent, so generate in parallel)
+  work = [(flag_num_classes, "i%d_" % ii, "i%d" % ii)
+          for ii in range(flag_num_instances)]
+  with multiprocessing.get_context("fork").Pool() as pool:
+    pool.starmap(gencode_classes.generate, work)
 
 
 def usage(msgarg):
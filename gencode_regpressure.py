@@ -13,90 +13,93 @@ import script_utils as u
 flag_copies = 4
 
 
-def emit_decl(v):
+def emit_decl(out, v):
   """Emit var decl."""
   for ii in range(0, flag_copies):
-    sys.stdout.write("  ull %s%d;\n" % (v, ii))
+    out.append("  ull %s%d;\n" % (v, ii))
 
 
-def emit_vinit(v, salt):
+def emit_vinit(out, v, salt):
   """Emit var init."""
   for ii in range(0, flag_copies):
-    sys.stdout.write("  %s%d = ar[(qx & %s) + %d];\n" % (v, ii, salt, ii))
+    out.append("  %s%d = ar[(qx & %s) + %d];\n" % (v, ii, salt, ii))
 
 
-def emit_binop(v1, v2, v3):
+def emit_binop(out, v1, v2, v3):
   """Emit bin op."""
   for ii in range(0, flag_copies):
-    sys.stdout.write("  %s%d = %s%d - %s%d;\n" % (v1, ii, v2, ii, v3, ii))
+    out.append("  %s%d = %s%d - %s%d;\n" % (v1, ii, v2, ii, v3, ii))
 
 
-def emit_trinop(v1, v2, v3, v4, v5):
+def emit_trinop(out, v1, v2, v3, v4, v5):
   """Emit trin op."""
   for ii in range(0, flag_copies):
-    sys.stdout.write("  %s%d = (%s%d - %s%d) ^ "
-                     "(%s%d + %s%d) ;\n" % (v1, ii, v2, ii,
-                                            v3, ii, v4, ii,
-                                            v5, ii))
+    out.append("  %s%d = (%s%d - %s%d) ^ "
+               "(%s%d + %s%d) ;\n" % (v1, ii, v2, ii,
+                                      v3, ii, v4, ii,
+                                      v5, ii))
 
 
-def emit_bitp(v1, v2, v3, c):
+def emit_bitp(out, v1, v2, v3, c):
   """Emit bitpick op."""
   for ii in range(0, flag_copies):
-    sys.stdout.write("  %s%d = %s%d | (%s%d & %s) "
-                     ";\n" % (v1, ii, v2, ii, v3, ii, c))
+    out.append("  %s%d = %s%d | (%s%d & %s) "
+               ";\n" % (v1, ii, v2, ii, v3, ii, c))
 
 
-def emit_store(v):
+def emit_store(out, v):
   """Emit store."""
   for ii in range(0, flag_copies):
-    sys.stdout.write("  ar[%d] = %s%d;\n" % (ii, v, ii))
+    out.append("  ar[%d] = %s%d;\n" % (ii, v, ii))
 
 
 def perform():
   """Emit C code."""
-  sys.stdout.write("\ntypedef unsigned ull;\n")
-  sys.stdout.write("ull foo(ull *ar, ull qx) {\n\n")
-  sys.stdout.write("  ull lcv = 100;\n")
+  # Collect output and write it all at once at the end.
+  out = []
+  out.append("\ntypedef unsigned ull;\n")
+  out.append("ull foo(ull *ar, ull qx) {\n\n")
+  out.append("  ull lcv = 100;\n")
 
   # Declare
   thevars = ["t", "q", "r", "s", "u"]
   for v in thevars:
-    emit_decl(v)
+    emit_decl(out, v)
 
   # Init t, q, r
-  emit_vinit("t", "19")
-  emit_vinit("q", "121")
-  emit_vinit("r", "117")
+  emit_vinit(out, "t", "19")
+  emit_vinit(out, "q", "121")
+  emit_vinit(out, "r", "117")
 
   # q = q - t
-  emit_binop("q", "q", "t")
+  emit_binop(out, "q", "q", "t")
 
   # define s
-  emit_vinit("s", "17")
+  emit_vinit(out, "s", "17")
 
   # loop
-  sys.stdout.write("\n  while(lcv--) {\n")
+  out.append("\n  while(lcv--) {\n")
 
   # r = (r - q) ^ (q - s)
-  emit_trinop("r", "r", "q", "q", "s")
+  emit_trinop(out, "r", "r", "q", "q", "s")
   # s = s + r
-  emit_binop("s", "s", "r")
+  emit_binop(out, "s", "s", "r")
 
-  sys.stdout.write("  }\n")
+  out.append("  }\n")
 
   # define u
-  emit_vinit("u", "0xff")
+  emit_vinit(out, "u", "0xff")
 
   # u = u | (s & c)
-  emit_bitp("u", "u", "s", "7")
+  emit_bitp(out, "u", "u", "s", "7")
 
   # store u
-  emit_store("u")
+  emit_store(out, "u")
 
   # that's it
-  sys.stdout.write("  return 0;\n")
-  sys.stdout.write("}\n")
+  out.append("  return 0;\n")
+  out.append("}\n")
+  sys.stdout.write("".join(out))
 
 
 def usage(msgarg):
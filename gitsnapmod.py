@@ -10,7 +10,9 @@ patch.
 import getopt
 import os
 import re
+import shutil
 import stat
+import subprocess
 import sys
 
 import script_utils as u
@@ -24,6 +26,9 @@ flag_destdir = None
 # key is file, value is M/A/D
 modifications = {}
 
+# files with op D (also in modifications), in order seen
+deletions = []
+
 # key is old file, val is new file
 renames = {}
 
@@ -43,14 +48,15 @@ flag_branch_to_diff = None
 # For -T option
 flag_base_branch = None
 
-
-def docmd(cmd):
-  """Execute a command."""
-  if flag_dryrun or u.verbosity_level() > 0:
-    sys.stderr.write("executing: " + cmd + "\n")
-  if flag_dryrun:
-    return
-  u.docmd(cmd)
+# Patterns for status lines from collect_modfiles():
+# blank line
+blankre = re.compile(r"^\s*$")
+# emacs backup file, ex: "foo.c.~1~"
+backupre = re.compile(r"^\S+\.~\d+~$")
+# modification, ex: "M  foo.c"
+modre = re.compile(r"^(\S+)\s+(\S+)$")
+# rename, ex: "R  foo.c -> bar.c"
+renamere = re.compile(r"^(\S+)\s+(\S+) \-\> (\S+)$")
 
 
 def docmdout(cmd, outfile, nf=None):
@@ -79,21 +85,17 @@ def collect_modfiles():
     stcmd = "git status -s"
   u.verbose(1, "modfiles git cmd: %s" % stcmd)
   lines = u.docmdlines(stcmd)
-  rs = re.compile(r"^\s*$")
-  rb = re.compile(r"^\S+\.~\d+~$")
-  r1 = re.compile(r"^(\S+)\s+(\S+)$")
-  r2 = re.compile(r"^(\S+)\s+(\S+) \-\> (\S+)$")
   for line in lines:
     u.verbose(2, "git status line: +%s+" % line.strip())
-    ms = rs.match(line)
+    ms = blankre.match(line)
     if ms:
       continue
-    m1 = r1.match(line)
+    m1 = modre.match(line)
     if m1:
       op = m1.group(1)
       modfile = m1.group(2)
       if op == "AM" or op == "MM" or op == "??":
-        if rb.match(modfile):
+        if backupre.match(modfile):
           continue
         u.error("found modified or untracked "
                 "file %s -- please run git add ." % modfile)
@@ -104,32 +106,28 @@ def collect_modfiles():
         u.error("internal error: mod file %s "
                 "already in table" % modfile)
       modifications[modfile] = op
+      if op == "D":
+        deletions.append(modfile)
       continue
-    m2 = r2.match(line)
+    m2 = renamere.match(line)
     if m2:
       op = m2.group(1)
       oldfile = m2.group(2)
       newfile = m2.group(3)
       if op == "RM":
         u.error("found modified file %s -- please run git add ." % newfile)
-      if oldfile in modifications:
+      if oldfile in modifications or oldfile in renames:
         u.error("internal error: src rename %s "
                 "already in modifications table" % oldfile)
-      if oldfile in renames:
-        u.error("internal error: src rename %s "
-                "already in modifications table" % oldfile)
-      if op == "R":
-        renames[oldfile] = newfile
-        rev_renames[newfile] = oldfile
-        if newfile in modifications:
-          u.error("internal error: dest of rename %s "
-                  "already in modifications table" % newfile)
-        renames[oldfile] = newfile
-        rev_renames[newfile] = oldfile
-        modifications[newfile] = "M"
-      else:
+      if op != "R":
         u.error("internal error: unknown op %s "
                 "in git status line %s" % (op, line))
+      if newfile in modifications:
+        u.error("internal error: dest of rename %s "
+                "already in modifications table" % newfile)
+      renames[oldfile] = newfile
+      rev_renames[newfile] = oldfile
+      modifications[newfile] = "M"
       continue
     u.error("internal error: pattern match failed "
             "for git status line %s" % line)
@@ -137,10 +135,6 @@ def collect_modfiles():
 
 def emit_deletions_and_renames():
   """Emit record of deletions and renames."""
-  deletions = {}
-  for afile, op in modifications.items():
-    if op == "D":
-      deletions[afile] = 1
   if deletions:
     outf = "%s/DELETIONS" % flag_destdir
     if flag_dryrun:
@@ -163,12 +157,18 @@ def copy_file(srcf, destf):
   """Copy a file."""
   if not os.path.exists(srcf):
     u.error("unable to copy src file %s: doesn't exist" % srcf)
+  if flag_dryrun or u.verbosity_level() > 0:
+    sys.stderr.write("copying %s to %s\n" % (srcf, destf))
+  if flag_dryrun:
+    return
   ddir = os.path.dirname(destf)
-  if not os.path.exists(ddir):
-    docmd("mkdir -p %s" % ddir)
+  os.makedirs(ddir, exist_ok=True)
   if os.path.exists(destf):
     os.chmod(destf, stat.S_IRWXU | stat.S_IRGRP | stat.S_IROTH)
-  docmd("cp %s %s" % (srcf, destf))
+  try:
+    shutil.copy2(srcf, destf)
+  except OSError as err:
+    u.error("copy of %s to %s failed: %s" % (srcf, destf, err))
 
 
 def write_protect(destf):
@@ -176,10 +176,46 @@ def write_protect(destf):
   os.chmod(destf, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
 
 
+def emit_base_versions(tofetch):
+  """Write out predecessor versions of files.
+
+  Here tofetch is a list of (sha:path, outfile) pairs. All of the blobs
+  are read through a single 'git cat-file --batch' process, as opposed
+  to running a separate 'git show' for each file.
+  """
+  if not tofetch:
+    return
+  if flag_dryrun or u.verbosity_level() > 0:
+    for spec, outf in tofetch:
+      sys.stderr.write("fetching: %s > %s\n" % (spec, outf))
+  if flag_dryrun:
+    return
+  cmd = "git cat-file --batch"
+  proc = subprocess.Popen(cmd.split(), stdin=subprocess.PIPE,
+                          stdout=subprocess.PIPE)
+  for spec, outf in tofetch:
+    proc.stdin.write(("%s\n" % spec).encode("utf-8"))
+    proc.stdin.flush()
+    # Reply is "<sha> blob <size>" followed by contents plus newline,
+    # or "<spec> missing" if there is no such object.
+    hdr = proc.stdout.readline().decode("utf-8").split()
+    if len(hdr) != 3 or hdr[1] != "blob":
+      u.error("%s failed for %s: %s" % (cmd, spec, " ".join(hdr)))
+    data = proc.stdout.read(int(hdr[2]) + 1)
+    with open(outf, "wb") as wf:
+      wf.write(data[:-1])
+  proc.stdin.close()
+  proc.stdout.close()
+  rc = proc.wait()
+  if rc != 0:
+    u.error("command failed (rc=%d): cmd was %s" % (rc, cmd))
+
+
 def emit_modified_files():
   """Archive copies of added/modified files."""
   showsha = current_sha
   nf = 0
+  tofetch = []
   if flag_oldsha:
     showsha = flag_oldsha
   for afile, op in modifications.items():
@@ -192,8 +228,8 @@ def emit_modified_files():
       toshow = afile
       if afile in rev_renames:
         toshow = rev_renames[afile]
-      docmdout("git show -M %s:%s" % (showsha, toshow),
-               "%s.BASE" % destf)
+      tofetch.append(("%s:%s" % (showsha, toshow), "%s.BASE" % destf))
+  emit_base_versions(tofetch)
   return nf
 
 
@@ -33,11 +33,27 @@ compilation path.
 
 """
 
-import getopt
 import os
+import sys
+
+# Fast path: most gccgo invocations in a build (links, C files, etc)
+# don't involve any Go source files, and in the default configuration
+# are just passed on to the real gccgo. Exec it right away, before
+# paying for the remaining imports; anything else (including failure
+# to exec the real driver) falls through to the regular code below.
+if (not os.environ.get("GOLLVM_WRAP_OPTIONS") and
+    "LANG" in os.environ and sys.argv[1:] != ["--install"] and
+    not any(a.endswith(".go") for a in sys.argv[1:])):
+  try:
+    os.execv("%s/gccgo.real" % os.path.dirname(sys.argv[0]), sys.argv)
+  except OSError:
+    pass
+
+# pylint: disable=wrong-import-position
+import getopt
+import hashlib
 import re
 import subprocess
-import sys
 
 import script_utils as u
 
@@ -53,6 +69,9 @@ flag_nollvm = False
 # trace llvm-goparse invocations
 flag_trace_llinvoc = False
 
+# Where form_golibargs() caches the go library dir
+cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "gollvm-wrap")
+
 
 def docmd(cmd):
   """Execute a command."""
@@ -64,7 +83,25 @@ def docmd(cmd):
 
 
 def form_golibargs(driver):
-  """Form correct go library args."""
+  """Form correct go library args.
+
+  The result is cached on disk (keyed by driver path and mtime), since
+  the go command invokes us once per package and the answer is the same
+  every time.
+  """
+  key = hashlib.blake2b(os.path.abspath(driver).encode()).hexdigest()[:16]
+  cachefile = os.path.join(cache_dir, "libdir.%s.%d" %
+                           (key, os.stat(driver).st_mtime_ns))
+  rdir = None
+  try:
+    with open(cachefile, "r") as rf:
+      rdir = rf.readline().strip()
+  except IOError:
+    pass
+  if rdir and os.path.isdir(rdir):
+    u.verbose(1, "libdir is %s (cached)" % rdir)
+    return ["-L", rdir]
+
   ddir = os.path.dirname(driver)
   bdir = os.path.dirname(ddir)
   cmd = "find %s/lib64 -name runtime.gox -print" % bdir
@@ -74,6 +111,14 @@ def form_golibargs(driver):
   line = lines[0]
   rdir = os.path.dirname(line)
   u.verbose(1, "libdir is %s" % rdir)
+  try:
+    os.makedirs(cache_dir, exist_ok=True)
+    tmpfile = "%s.%d" % (cachefile, os.getpid())
+    with open(tmpfile, "w") as wf:
+      wf.write("%s\n" % rdir)
+    os.replace(tmpfile, cachefile)
+  except OSError as err:
+    u.verbose(1, "unable to cache libdir in %s: %s" % (cache_dir, err))
   return ["-L", rdir]
 
 
@@ -110,28 +155,27 @@ def perform():
     os.execv(driver, args)
     u.error("exec failed: %s" % driver)
 
-  # Create a set of massaged args.
+  # Create a set of massaged args, with output redirected to an
+  # assembly file (for each -o; the last one wins).
   nargs = []
-  skipc = 0
   outfile = None
-  asmfile = None
-  for ii in range(1, len(sys.argv)):
-    clarg = sys.argv[ii]
-    if skipc != 0:
-      skipc -= 1
-      continue
-    if clarg == "-o":
-      skipc = 1
-      outfile = sys.argv[ii+1]
-      asmfile = "%s.s" % outfile
-      nargs.append("-o")
-      nargs.append(asmfile)
-      continue
-    nargs.append(clarg)
-
-  if not asmfile or not outfile:
+  start = 1
+  while True:
+    try:
+      oi = sys.argv.index("-o", start)
+    except ValueError:
+      break
+    if oi + 1 >= len(sys.argv):
+      u.error("fatal error: no file after -o "
+              "option in clargs: %s" % " ".join(sys.argv))
+    outfile = sys.argv[oi+1]
+    nargs += sys.argv[start:oi] + ["-o", "%s.s" % outfile]
+    start = oi + 2
+  nargs += sys.argv[start:]
+  if not outfile:
     u.error("fatal error: unable to find -o "
             "option in clargs: %s" % " ".join(sys.argv))
+  asmfile = "%s.s" % outfile
   golibargs = form_golibargs(sys.argv[0])
   nargs += golibargs
   u.verbose(1, "revised args: %s" % " ".join(nargs))
@@ -12,21 +12,14 @@ import script_utils as u
 
 #......................................................................
 
-lines = sys.stdin.readlines()
-recol = re.compile(r"^\s/.+/collect2\s+.+$")
-reld = re.compile(r"^\s/.+/ld.gold\s+.+$")
+# Link line (collect2 or gold invocation), ex:
+# " /usr/libexec/gcc/x86_64-linux-gnu/9/collect2 -plugin ..."
+linkre = re.compile(r"^\s/.+/(?:collect2|ld\.gold)\s+.+$")
 found = False
-for line in lines:
-  if recol.match(line):
+for line in sys.stdin:
+  if linkre.match(line):
     chunks = line.split()
-    for c in chunks:
-      sys.stdout.write("%s\n" % c)
-    found = True
-    break
-  if reld.match(line):
-    chunks = line.split()
-    for c in chunks:
-      sys.stdout.write("%s\n" % c)
+    sys.stdout.write("%s\n" % "\n".join(chunks))
     found = True
     break
 if not found:
@@ -5,12 +5,11 @@ Runs objdump to gather load module dependency relationships.
 
 """
 
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import getopt
-import locale
+import json
 import os
 import re
-import shlex
 import subprocess
 import sys
 import script_utils as u
@@ -41,6 +40,9 @@ flag_prune = False
 # Include backward slice of depth N
 flag_backward_slice = 0
 
+# Use on-disk cache of objdump scan results (disabled with -C)
+flag_use_cache = True
+
 # Setting of $ANDROID_BUILD_TOP
 abt = ""
 
@@ -52,15 +54,15 @@ aho = ""
 
 # Load module dependency table. Key is load module name (not path),
 # value is dict of dependency names. rdepends is reverse graph
-depends = defaultdict(lambda: defaultdict(str))
-rdepends = defaultdict(lambda: defaultdict(str))
+depends = {}
+rdepends = {}
 
 # Populated with all possible load modules of interest. Key
 # is load module path, value is 0 (unvisited) or 1 (visited).
 all_loadmodules = {}
 
 # Maps load module base name to dict of paths
-base_to_paths = defaultdict(lambda: defaultdict(str))
+base_to_paths = {}
 
 # Things to omit for -p option
 toprune = {"libm.so": 1, "libc.so": 1, "libdl.so": 1, "libc++.so": 1}
@@ -68,6 +70,39 @@ toprune = {"libm.so": 1, "libc.so": 1, "libdl.so": 1, "libc++.so": 1}
 # Node colors (key is soname)
 nodecolor = {}
 
+# Results of scan_deps(), keyed by load module path
+scanned = {}
+
+# On-disk cache of scan_deps() results from previous runs. Key is
+# absolute path, value is [mtime_ns, size, soname, list of deps].
+scan_cache_file = os.path.join(os.path.expanduser("~"), ".cache",
+                               "graph-loadmodule-deps", "cache.json")
+scan_cache = {}
+
+# Max number of files to hand to a single objdump invocation
+objdump_batch_size = 64
+
+# Start of objdump output for a given file, ex:
+# "/x/libc.so:     file format elf64-x86-64"
+banner_re = re.compile(r"^(.+):\s+file format \S+$")
+
+# Dynamic section entry in objdump -p output, ex:
+# "  NEEDED               libc.so.6"
+dynentry_re = re.compile(r"^\s+(\S+)\s+(\S+)\s*$")
+
+# Objdump flavor to use, keyed by ELF e_machine value
+objdump_for_machine = {0xB7: "aarch64-linux-android-objdump",
+                       0x28: "arm-linux-androideabi-objdump",
+                       0x3E: "objdump",
+                       0x03: "objdump"}
+
+# Maps non-alphanumeric chars to "_" (for DOT node names)
+nodename_table = {c: "_" for c in range(128) if not chr(c).isalnum()}
+
+# Path within symbols dir, ex:
+# "out/target/product/x/symbols/system/lib64/libc.so"
+symbols_re = re.compile(r"^(\S+)\/symbols\/\S+$")
+
 
 def in_symbols_dir(filename):
   """Make sure input file is part of $ANROID_PRODUCT_OUT/symbols."""
@@ -76,8 +111,7 @@ def in_symbols_dir(filename):
     return True
 
   u.verbose(2, "in_symbols_dir(%s)" % filename)
-  smatch = re.compile(r"^(\S+)\/symbols\/\S+$")
-  sm = smatch.match(filename)
+  sm = symbols_re.match(filename)
   if sm is None:
     u.verbose(2, "/symbols/ match failed for %s" % filename)
     return False
@@ -89,93 +123,148 @@ def in_symbols_dir(filename):
   return fp == apo
 
 
+def read_elf_header(filename):
+  """Return (class, machine) from ELF header, class being 32 or 64."""
+  try:
+    with open(filename, "rb") as f:
+      hdr = f.read(20)
+  except IOError as err:
+    u.error("unable to read %s: %s" % (filename, err))
+  if len(hdr) < 20 or hdr[:4] != b"\x7fELF":
+    u.error("%s is not an ELF file" % filename)
+  eclass = {1: 32, 2: 64}.get(hdr[4])
+  if not eclass:
+    u.error("internal error: bad elf %s class %d" % (filename, hdr[4]))
+  byteorder = "little" if hdr[5] == 1 else "big"
+  return eclass, int.from_bytes(hdr[18:20], byteorder)
+
+
 def determine_objdump(filename):
   """Figure out what flavor of object dumper we should use."""
   global objdump_cmd
 
-  lines = u.docmdlines("file %s" % filename)
-  matchers = [(re.compile(r".*ELF.+ARM aarch64"),
-               "aarch64-linux-android-objdump"),
-              (re.compile(r".*ELF.+ARM"),
-               "arm-linux-androideabi-objdump"),
-              (re.compile(r".*ELF.+x86\-64"),
-               "objdump"),
-              (re.compile(r".*ELF.+Intel"),
-               "objdump")]
-  for l in lines:
-    for tup in matchers:
-      m = tup[0]
-      res = m.match(l)
-      if res is None:
-        continue
-      objdump_cmd = tup[1]
-      return
-  u.error("unable to determine objdump flavor to use on %s" % filename)
+  _, machine = read_elf_header(filename)
+  if machine not in objdump_for_machine:
+    u.error("unable to determine objdump flavor to use on %s "
+            "(e_machine %d)" % (filename, machine))
+  objdump_cmd = objdump_for_machine[machine]
 
 
-def run_objdump_cmd(cargs, filename):
-  """Run objdump with specified args, returning list of lines."""
+def run_objdump_cmd(cargs, filename, section=None):
+  """Run objdump with specified args, returning list of lines.
+
+  Output is read as it is produced; if section is given (ex:
+  "Dynamic Section:"), objdump is stopped once the end of that section
+  has been reached, and only lines up to that point are returned.
+  """
 
   if not objdump_cmd:
     determine_objdump(filename)
 
-  cmd = "%s %s %s" % (objdump_cmd, cargs, filename)
-  u.verbose(2, "objdump cmd: %s" % cmd)
-  splargs = shlex.split(cmd)
-  mypipe = subprocess.Popen(splargs, stdout=subprocess.PIPE)
-  pout, _ = mypipe.communicate()
-  if mypipe.returncode != 0:
-    u.error("command failed (rc=%d): cmd was %s" % (mypipe.returncode, cmd))
-  encoding = locale.getdefaultlocale()[1]
-  decoded = pout.decode(encoding)
-  return decoded.strip().split("\n")
-
+  args = [objdump_cmd] + cargs.split() + [filename]
+  u.verbose(2, "objdump cmd: %s" % " ".join(args))
+  lines = []
+  insection = False
+  stopped = False
+  with subprocess.Popen(args, stdout=subprocess.PIPE,
+                        encoding="utf-8", errors="replace") as proc:
+    for line in proc.stdout:
+      line = line.rstrip("\n")
+      lines.append(line)
+      if section and line == section:
+        insection = True
+      elif insection and not line:
+        stopped = True
+        proc.kill()
+        break
+  if proc.returncode != 0 and not stopped:
+    u.error("command failed (rc=%d): cmd was %s" % (proc.returncode,
+                                                     " ".join(args)))
+  while lines and not lines[-1]:
+    lines.pop()
+  while lines and not lines[0]:
+    lines.pop(0)
+  return lines
+
+
+def run_objdump_batch(cargs, filenames):
+  """Run objdump on several files at once.
+
+  Returns dict mapping each file name to its list of output lines, as
+  would have been returned by run_objdump_cmd for that file alone.
+  """
 
-def skip_this_elf(filename, lines, eflav):
+  if not objdump_cmd:
+    determine_objdump(filenames[0])
+
+  args = [objdump_cmd] + cargs.split() + filenames
+  u.verbose(2, "objdump cmd: %s" % " ".join(args))
+
+  # Output for each file starts with a "<file>: file format" banner.
+  results = {}
+  lines = None
+  with subprocess.Popen(args, stdout=subprocess.PIPE,
+                        encoding="utf-8", errors="replace") as proc:
+    for line in proc.stdout:
+      line = line.rstrip("\n")
+      m = banner_re.match(line)
+      if m and m.group(1) in filenames and m.group(1) not in results:
+        lines = results[m.group(1)] = []
+      if lines is not None:
+        lines.append(line)
+  if proc.returncode != 0:
+    u.error("command failed (rc=%d): cmd was %s" % (proc.returncode,
+                                                     " ".join(args)))
+  for f in filenames:
+    if f not in results:
+      u.error("internal error: no objdump output for %s" % f)
+    while results[f] and not results[f][-1]:
+      results[f].pop()
+  return results
+
+
+def skip_this_elf(filename, eflav):
   """Return whether we should skip this elf."""
-  matcher = re.compile(r"^\S+:\s+file format elf(\d\d)\-")
-  for line in lines:
-    if not line:
-      continue
-    m = matcher.match(line)
-    if m:
-      dd = int(m.group(1))
-      if dd != 32 and dd != 64:
-        u.error("internal error: bad elf %s flavor %d "
-                "(line %s)" % (filename, dd, line))
-      if dd != eflav:
-        # Not correct flavor
-        return True
-      else:
-        return False
-  u.error("internal error: could not find file format line")
-
-
-def examine_deps(filename):
-  """Run objdump to collect depends info."""
-
-  u.verbose(2, "examine_deps(%s)" % filename)
-  objdump_args = "-p"
-  lines = run_objdump_cmd(objdump_args, filename)
-  if flag_restrict_elf and skip_this_elf(filename, lines, flag_restrict_elf):
-    u.verbose(1, "skipping file %s, wrong elf flavor" % filename)
-    return None
+  eclass, _ = read_elf_header(filename)
+  return eclass != eflav
+
+
+def scan_deps(filename, lines=None):
+  """Return (soname, deps) for file, or None if it should be skipped.
+
+  Runs objdump on the file unless its output is passed in via lines
+  (in which case the file is assumed to have passed the -r check).
+  This has no side effects on the dependency tables, so that it can be
+  run on multiple files concurrently (see prescan below).
+  """
+
+  u.verbose(2, "scan_deps(%s)" % filename)
+  if lines is None:
+    if flag_restrict_elf and skip_this_elf(filename, flag_restrict_elf):
+      u.verbose(1, "skipping file %s, wrong elf flavor" % filename)
+      return None
+    if flag_use_cache:
+      res = cached_scan(filename)
+      if res:
+        return res
+    # NEEDED/SONAME entries are all in the dynamic section, no need
+    # to wait for the rest of the output.
+    objdump_args = "-p"
+    lines = run_objdump_cmd(objdump_args, filename, "Dynamic Section:")
 
   bn = os.path.basename(filename)
   u.verbose(2, "examining objdump output for %s (%s)" % (bn, filename))
 
-  # Pattern we're looking for in the objdump output
-  matcher = re.compile(r"^\s+(\S+)\s+(\S+)\s*$")
-
   deps = {}
   soname = None
 
   # Run through all of the lines:
+  match = dynentry_re.match
   for line in lines:
     if not line:
       continue
     # Match
-    m = matcher.match(line)
+    m = match(line)
     if m:
       which = m.group(1)
       if which == "NEEDED":
@@ -191,28 +280,146 @@ def examine_deps(filename):
                 "basename for file %s" % (soname, filename))
   else:
     soname = bn
+  return soname, deps
+
+
+def load_scan_cache():
+  """Read cached scan results from previous runs, if any."""
+  global scan_cache
+
+  if not flag_use_cache:
+    return
+  try:
+    with open(scan_cache_file, "r") as rf:
+      scan_cache = json.load(rf)
+  except (IOError, ValueError) as err:
+    u.verbose(1, "not using scan cache %s: %s" % (scan_cache_file, err))
+    scan_cache = {}
+  u.verbose(1, "read %d scan cache entries" % len(scan_cache))
+
+
+def cached_scan(filename):
+  """Return cached scan_deps result for file, or None if not cached.
+
+  Entries are only used if the file's mtime and size still match.
+  """
+  ent = scan_cache.get(os.path.abspath(filename))
+  if not ent:
+    return None
+  st = os.stat(filename)
+  if ent[0] != st.st_mtime_ns or ent[1] != st.st_size:
+    return None
+  u.verbose(2, "using cached scan for %s" % filename)
+  return ent[2], dict.fromkeys(ent[3], 1)
+
+
+def save_scan_cache():
+  """Add results from this run to the scan cache and write it out."""
+  if not flag_use_cache:
+    return
+  changed = False
+  for filename, res in scanned.items():
+    if not res:
+      continue
+    st = os.stat(filename)
+    ent = [st.st_mtime_ns, st.st_size, res[0], list(res[1])]
+    path = os.path.abspath(filename)
+    if scan_cache.get(path) != ent:
+      scan_cache[path] = ent
+      changed = True
+  if not changed:
+    return
+  u.verbose(1, "writing %d entries to %s" % (len(scan_cache),
+                                            scan_cache_file))
+  try:
+    os.makedirs(os.path.dirname(scan_cache_file), exist_ok=True)
+    tmpfile = "%s.%d" % (scan_cache_file, os.getpid())
+    with open(tmpfile, "w") as wf:
+      json.dump(scan_cache, wf)
+    os.replace(tmpfile, scan_cache_file)
+  except OSError as err:
+    u.warning("unable to write scan cache %s: %s" % (scan_cache_file, err))
+
+
+def scan_batch(filenames):
+  """Run scan_deps on a batch of files using a single objdump."""
+  outputs = run_objdump_batch("-p", filenames)
+  return [scan_deps(f, outputs[f]) for f in filenames]
+
+
+def prescan(filenames):
+  """Run scan_deps on files in parallel, caching the results.
+
+  Files are handed to objdump in batches, so as to pay the process
+  startup cost once per batch as opposed to once per file. The bulk of
+  the time here goes into waiting on objdump subprocesses, so threads
+  are sufficient to keep several batches going at once.
+  """
+  todo = [f for f in dict.fromkeys(filenames) if f not in scanned]
+  # No need to run objdump on files of the wrong flavor, or on
+  # files with results cached from a previous run.
+  for f in todo:
+    if flag_restrict_elf and skip_this_elf(f, flag_restrict_elf):
+      u.verbose(1, "skipping file %s, wrong elf flavor" % f)
+      scanned[f] = None
+    elif flag_use_cache:
+      res = cached_scan(f)
+      if res:
+        scanned[f] = res
+  todo = [f for f in todo if f not in scanned]
+  if not todo:
+    return
+  if not objdump_cmd:
+    determine_objdump(todo[0])
+  nworkers = os.cpu_count() or 4
+  # Small enough batches so that all workers get something to do.
+  bsize = min(objdump_batch_size, -(-len(todo) // nworkers))
+  batches = [todo[i:i+bsize] for i in range(0, len(todo), bsize)]
+  with ThreadPoolExecutor(max_workers=nworkers) as ex:
+    for batch, results in zip(batches, ex.map(scan_batch, batches)):
+      for f, res in zip(batch, results):
+        scanned[f] = res
+
+
+def examine_deps(filename):
+  """Collect depends info for file, running objdump if needed."""
+
+  u.verbose(2, "examine_deps(%s)" % filename)
+  if filename not in scanned:
+    scanned[filename] = scan_deps(filename)
+  res = scanned[filename]
+  if not res:
+    return None
+  soname, deps = res
   if deps:
-    ddict = depends[soname]
+    ddict = depends.setdefault(soname, {})
     for d in deps:
       u.verbose(2, "processing dep %s -> %s" % (soname, d))
       ddict[d] = 1
-      rdict = rdepends[d]
-      rdict[soname] = 1
+      rdepends.setdefault(d, {})[soname] = 1
 
   return soname
 
 
+def resolve_loadmodule(filename):
+  """Return key in all_loadmodules for file, or None if not present."""
+  if filename in all_loadmodules:
+    return filename
+  fullpath = os.path.join(os.getcwd(), filename)
+  if fullpath in all_loadmodules:
+    return fullpath
+  return None
+
+
 def examinefile(filename):
   """Perform symbol analysis on specified file."""
   u.verbose(2, "examinefile(%s)" % filename)
-  if filename not in all_loadmodules:
-    fullpath = os.path.join(os.getcwd(), filename)
-    if fullpath in all_loadmodules:
-      filename = fullpath
-    else:
-      u.warning("unable to visit %s (not "
-                "in %s out)" % (filename, flag_filemode))
-      return
+  lm = resolve_loadmodule(filename)
+  if not lm:
+    u.warning("unable to visit %s (not "
+              "in %s out)" % (filename, flag_filemode))
+    return
+  filename = lm
   if all_loadmodules[filename] == 1:
     return
   if not in_symbols_dir(filename):
@@ -225,13 +432,12 @@ def examinefile(filename):
     all_loadmodules[filename] = 1
     return
   worklist = []
-  ddict = depends[soname]
-  for dep in ddict:
-    pdict = base_to_paths[dep]
-    for path in pdict:
+  for dep in depends.get(soname, ()):
+    for path in base_to_paths.get(dep, ()):
       if path in all_loadmodules and all_loadmodules[path] == 0:
         all_loadmodules[path] = 1
         worklist.append(path)
+  prescan(worklist)
   for item in worklist:
     examine_deps(item)
 
@@ -240,28 +446,22 @@ def collect_all_loadmodules():
   """Collect names of all interesting loadmodules."""
   locations = None
   if flag_filemode == "target":
-    locations = "%s/symbols/system" % apo
+    locations = ["%s/symbols/system" % apo]
   else:
-    locations = "%s/bin %s/lib64" % (aho, aho)
-  u.verbose(1, "collecting loadmodules from %s" % locations)
-  cmd = "find %s -type f -print" % locations
-  u.verbose(1, "find cmd: %s" % cmd)
-  cargs = shlex.split(cmd)
-  mypipe = subprocess.Popen(cargs, stdout=subprocess.PIPE)
-  pout, _ = mypipe.communicate()
-  if mypipe.returncode != 0:
-    u.error("command failed (rc=%d): cmd was %s" % (mypipe.returncode, cmd))
-  encoding = locale.getdefaultlocale()[1]
-  decoded = pout.decode(encoding)
-  lines = decoded.strip().split("\n")
-  u.verbose(1, "found a total of %d load modules" % len(lines))
-  for line in lines:
-    path = line.strip()
+    locations = ["%s/bin" % aho, "%s/lib64" % aho]
+  u.verbose(1, "collecting loadmodules from %s" % " ".join(locations))
+  paths = []
+  for loc in locations:
+    try:
+      paths.extend(u.find_files(loc))
+    except OSError as err:
+      u.error("unable to collect loadmodules: %s" % err)
+  u.verbose(1, "found a total of %d load modules" % len(paths))
+  for path in paths:
     u.verbose(2, "adding LM %s" % path)
     all_loadmodules[path] = 0
     bn = os.path.basename(path)
-    pdict = base_to_paths[bn]
-    pdict[path] = 1
+    base_to_paths.setdefault(bn, {})[path] = 1
   if flag_backward_slice:
     for filearg in flag_input_files:
       bn = os.path.basename(filearg)
@@ -275,65 +475,96 @@ def get_nodename(soname, nodenames):
   if soname in nodenames:
     return nodenames[soname]
   nn = len(nodenames)
-  seed = "".join([x if x.isalnum() else "_" for x in soname])
+  if soname.isascii():
+    seed = soname.translate(nodename_table)
+  else:
+    seed = "".join([x if x.isalnum() else "_" for x in soname])
   nn = "%s_%d" % (seed, nn)
   nodenames[soname] = nn
   return nn
 
 
-def emit_helper(fh, soname, mode, emitted, nodenames, restrictnodes):
-  """Emit dot node."""
-  if soname in emitted:
-    return
-  emitted[soname] = 1
-  this_nn = get_nodename(soname, nodenames)
-  if mode == "node":
-    if not flag_prune or soname not in toprune:
-      shape = "record"
-      if soname in input_sonames:
-        shape = "box3d"
-      color = "lightblue"
-      if soname in nodecolor:
-        color = nodecolor[soname]
-      fh.write(" %s [shape=%s,style=filled,"
-               "fillcolor=%s,"
-               "label=\"%s\"];\n" % (this_nn, shape, color, soname))
-  ddict = depends[soname]
-  for dep in ddict:
-    res = False
+def emit_helper(soname, emitted, nodenames, restrictnodes,
+                nodelines, edgelines):
+  """Collect dot nodes/edges reachable from soname (iterative DFS).
+
+  Node and edge text is appended to nodelines and edgelines
+  respectively; either can be None if that kind is not wanted.
+  """
+  stack = []
+
+  def visit(soname):
+    """Emit node (if needed) and schedule its deps for visiting."""
+    if soname in emitted:
+      return
+    emitted[soname] = 1
+    this_nn = get_nodename(soname, nodenames)
+    if nodelines is not None:
+      if not flag_prune or soname not in toprune:
+        shape = "record"
+        if soname in input_sonames:
+          shape = "box3d"
+        color = "lightblue"
+        if soname in nodecolor:
+          color = nodecolor[soname]
+        nodelines.append(" %s [shape=%s,style=filled,"
+                         "fillcolor=%s,"
+                         "label=\"%s\"];\n" % (this_nn, shape, color,
+                                                 soname))
+    stack.append((this_nn, iter(depends.get(soname, ()))))
+
+  visit(soname)
+  while stack:
+    this_nn, deps = stack[-1]
+    dep = next(deps, None)
+    if dep is None:
+      stack.pop()
+      continue
     if restrictnodes and dep not in restrictnodes:
-      res = True
+      continue
     if flag_prune and dep in toprune:
-      res = True
-    if res:
       continue
-    if mode == "edge":
+    if edgelines is not None:
       dep_nn = get_nodename(dep, nodenames)
-      fh.write(" %s -> %s [style=\"solid,bold\","
-               "color=black,weight=10,constraint=true];\n" % (this_nn, dep_nn))
-    emit_helper(fh, dep, mode, emitted, nodenames, restrictnodes)
+      edgelines.append(" %s -> %s [style=\"solid,bold\","
+                       "color=black,weight=10,"
+                       "constraint=true];\n" % (this_nn, dep_nn))
+    visit(dep)
 
 
 def collect_slice_nodes(seednode, depth):
   """Collect nodes in backward slice."""
   if depth == 0:
-    return
+    return None
   rval = {}
-  rdict = rdepends[seednode]
-  for rdep in rdict:
+  for rdep in rdepends.get(seednode, ()):
     rval[rdep] = 1
-    nodecolor[rdep] = "lightyellow"
-    collect_slice_nodes(rdep, depth-1)
+  # Breadth-first walk out to the requested depth, expanding each
+  # node only the first time it is reached.
+  visited = {seednode: 1}
+  frontier = [seednode]
+  for _ in range(depth):
+    nextfrontier = []
+    for node in frontier:
+      for rdep in rdepends.get(node, ()):
+        nodecolor[rdep] = "lightyellow"
+        if rdep not in visited:
+          visited[rdep] = 1
+          nextfrontier.append(rdep)
+    frontier = nextfrontier
   return rval
 
 
 def emit_to_file(fh):
   """Emit output DOT to file or stdout."""
-  fh.write("digraph \"graph\" {\n")
-  fh.write(" overlap=false;\n")
 
-  # Nodes
-  nodes_emitted = {}
+  # Nodes and edges reachable from the inputs are collected in a
+  # single walk; the slice (if any) is then added to each.
+  inputnodes = []
+  inputedges = []
+  slicenodelines = []
+  sliceedgelines = []
+  emitted = {}
   nodenames = {}
   slicenodes = {}
   empty = {}
@@ -345,25 +576,29 @@ def emit_to_file(fh):
   u.verbose(1, "input sonames: %s" % " ".join(list(input_sonames.keys())))
   for filename in flag_input_files:
     bn = os.path.basename(filename)
-    emit_helper(fh, bn, "node", nodes_emitted, nodenames, empty)
+    emit_helper(bn, emitted, nodenames, empty, inputnodes, inputedges)
     preds = collect_slice_nodes(bn, flag_backward_slice)
     if preds:
       slicenodes.update(preds)
-  restrictnodes.update(nodes_emitted)
+  restrictnodes.update(emitted)
   if slicenodes:
     u.verbose(1, "slice nodes: %s" % " ".join(list(slicenodes.keys())))
+  nodes_emitted = dict(emitted)
   for slicenode in slicenodes:
     restrictnodes[slicenode] = 1
-    emit_helper(fh, slicenode, "node", nodes_emitted, nodenames, nodes_emitted)
+    emit_helper(slicenode, nodes_emitted, nodenames, nodes_emitted,
+                slicenodelines, None)
   u.verbose(1, "restrictnodes: %s" % " ".join(list(restrictnodes.keys())))
-
-  # Edges
-  edges_emitted = {}
-  for filename in flag_input_files:
-    bn = os.path.basename(filename)
-    emit_helper(fh, bn, "edge", edges_emitted, nodenames, empty)
   for slicenode in slicenodes:
-    emit_helper(fh, slicenode, "edge", edges_emitted, nodenames, restrictnodes)
+    emit_helper(slicenode, emitted, nodenames, restrictnodes,
+                None, sliceedgelines)
+
+  fh.write("digraph \"graph\" {\n")
+  fh.write(" overlap=false;\n")
+  fh.writelines(inputnodes)
+  fh.writelines(slicenodelines)
+  fh.writelines(inputedges)
+  fh.writelines(sliceedgelines)
   fh.write("}\n")
 
 
@@ -393,6 +628,8 @@ def usage(msgarg):
     -p         omit nodes for common "base" libraries, including
                libc.so, libdl.so, libm.so, libc++.so
     -B N       include backward slice of depth N from input load modules
+    -C         don't read or update cache of objdump results
+               (kept in ~/.cache/graph-loadmodule-deps)
 
     Notes:
      - arguments are expected to be linked (.so or .exe) but unstripped
@@ -407,10 +644,10 @@ def parse_args():
   global flag_check_in_symbols, flag_filemode
   global flag_input_files, apo, abt, aho
   global flag_restrict_elf, flag_outfile, flag_prune
-  global flag_backward_slice
+  global flag_backward_slice, flag_use_cache
 
   try:
-    optlist, args = getopt.getopt(sys.argv[1:], "dpHB:Xr:o:")
+    optlist, args = getopt.getopt(sys.argv[1:], "dpCHB:Xr:o:")
   except getopt.GetoptError as err:
     # unrecognized option
     usage(str(err))
@@ -420,6 +657,8 @@ def parse_args():
       u.increment_verbosity()
     elif opt == "-p":
       flag_prune = True
+    elif opt == "-C":
+      flag_use_cache = False
     elif opt == "-H":
       flag_filemode = "host"
     elif opt == "-B":
@@ -463,11 +702,16 @@ def parse_args():
 
 parse_args()
 u.setdeflanglocale()
+load_scan_cache()
 collect_all_loadmodules()
 if flag_backward_slice:
+  prescan([f for f in all_loadmodules if in_symbols_dir(f)])
   for f in all_loadmodules:
     examinefile(f)
 else:
+  prescan([lm for lm in map(resolve_loadmodule, flag_input_files)
+           if lm and in_symbols_dir(lm)])
   for filearg in flag_input_files:
     examinefile(filearg)
+save_scan_cache()
 emit()
@@ -5,6 +5,7 @@ Read stdin converting hex text to binary.
 
 """
 
+import functools
 import getopt
 import os
 import sys
@@ -14,6 +15,8 @@ import script_utils as u
 flag_reverse = False
 
 
+# Memoized, since dumps tend to repeat the same values over and over.
+@functools.lru_cache(maxsize=65536)
 def convert(s):
   """Convert hex to binary or vice versa."""
   if flag_reverse:
@@ -27,6 +30,8 @@ def convert(s):
       v = int(s, 16)
     except ValueError:
       return s
+    if v >= 0:
+      return format(v, "08b")
     return bin(v)[2:].zfill(8)
 
 
@@ -66,11 +71,9 @@ def parse_args():
 u.setdeflanglocale()
 parse_args()
 
-# Read
-lines = sys.stdin.readlines()
-for line in lines:
-  chunks = line.strip().split();
-  res = []
-  for chunk in chunks:
-    res.append(convert(chunk))
-  print(" ".join(res))
+# Read, convert, then write everything out at once
+out = []
+for line in sys.stdin:
+  out.append(" ".join(map(convert, line.split())))
+  out.append("\n")
+sys.stdout.write("".join(out))
@@ -19,18 +19,22 @@ import script_utils as u
 #......................................................................
 
 lines = sys.stdin.readlines()
-tups = []
-for line in lines:
-  chunks = line.split()
-  if chunks[0]:
+keys = []
+for idx, line in enumerate(lines):
+  chunks = line.split(None, 1)
+  if chunks:
     nbytes = u.hr_size_to_bytes(chunks[0])
     if not nbytes:
       continue
-    tup = (nbytes, chunks[0], " ".join(chunks[1:]))
-    tups.append(tup)
+    keys.append((nbytes, idx))
   else:
     u.warning("malformed 'du' output line %s" % line)
 
-stups = sorted(tups)
-for t in stups:
-  print("%-10s %s" % (t[1], t[2]))
+# Sort on size alone; output lines are only formatted once ordered.
+keys.sort()
+out = []
+for _, idx in keys:
+  chunks = lines[idx].split(None, 1)
+  rest = " ".join(chunks[1].split()) if len(chunks) > 1 else ""
+  out.append("%-10s %s\n" % (chunks[0], rest))
+sys.stdout.write("".join(out))
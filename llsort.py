@@ -55,10 +55,8 @@ parse_args()
 
 # Read
 d = defaultdict(list)
-lines = sys.stdin.readlines()
-for line in lines:
-  ll = len(line)
-  d[ll].append(line)
+for line in sys.stdin:
+  d[len(line)].append(line)
 
 # Sort
 dkeys = list(d.keys())
@@ -6,6 +6,7 @@
 import getopt
 import os
 import re
+import shutil
 import sys
 
 import script_utils as u
@@ -43,6 +44,9 @@ flag_checkbuild = False
 # Parallel factor
 flag_parfactor = 40
 
+# Compile via ccache
+flag_use_ccache = False
+
 
 def usage(msgarg):
   """Print usage and exit."""
@@ -63,6 +67,7 @@ def usage(msgarg):
     -x A  add extra make arg A (for top level make)
     -j N  set parallel build factor to N
     -k    pass -k when invoking make
+    -c    compile via ccache (unless USE_CCACHE is already set)
 
     Example 1: rebuild art (no deps)
 
@@ -85,10 +90,10 @@ def parse_args():
   """Command line argument parsing."""
   global flag_subdir, flag_strace, flag_toplevel, flag_dryrun
   global flag_showcommands, flag_dependencies, flag_parfactor
-  global flag_dashk, flag_checkbuild
+  global flag_dashk, flag_checkbuild, flag_use_ccache
 
   try:
-    optlist, args = getopt.getopt(sys.argv[1:], "adkstTDSx:j:")
+    optlist, args = getopt.getopt(sys.argv[1:], "acdkstTDSx:j:")
   except getopt.GetoptError as err:
     # unrecognized option
     usage(str(err))
@@ -116,6 +121,8 @@ def parse_args():
       flag_extra_make_args.append(arg)
     elif opt == "-j":
       flag_parfactor = int(arg)
+    elif opt == "-c":
+      flag_use_ccache = True
 
   if not flag_toplevel:
     if not args:
@@ -142,11 +149,23 @@ if not flag_toplevel and not flag_dependencies:
               "SHOT_MAKEFILE\"] to %s" % mkfile)
 
 if not flag_dryrun:
-  rc = u.doscmd("which jack-admin", nf=True)
-  if rc == 0:
+  if shutil.which("jack-admin"):
     flag_use_jack = True
     u.doscmd("jack-admin start-server")
 
+# If asked to, let the Android build system (build/core/ccache.mk) wrap
+# compiles with ccache, so that repeated builds (ex: multiple lunch targets
+# from multi-device-android-build.py) mostly hit in the cache. The
+# cache itself lives in ~/.ccache unless CCACHE_DIR says otherwise,
+# so it survives removal of $ANDROID_PRODUCT_OUT.
+if flag_use_ccache and "USE_CCACHE" not in os.environ:
+  ccache = shutil.which("ccache")
+  if not ccache:
+    u.error("-c specified but ccache not found in PATH")
+  u.verbose(1, "compiling via %s" % ccache)
+  os.environ["USE_CCACHE"] = "1"
+  os.environ["CCACHE_EXEC"] = ccache
+
 here = os.getcwd()
 am = "all_modules"
 if flag_toplevel:
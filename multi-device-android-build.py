@@ -39,12 +39,16 @@ Todo:
 
 """
 
-import copy
 import getopt
+import hashlib
+import json
+import multiprocessing
 import os
 import re
 import shutil
+import subprocess
 import sys
+import tempfile
 import time
 
 import script_utils as u
@@ -100,6 +104,12 @@ flag_mmma_target = None
 # Parallel factor
 flag_parfactor = 40
 
+# Number of builds to run concurrently
+flag_concurrent_builds = 1
+
+# Background "rm -rf" processes for cleaned-up build output dirs
+pending_removals = []
+
 # Stop after first failure
 flag_exit_on_err = False
 
@@ -109,6 +119,9 @@ tag_to_serial = {}
 # Maps device codename (ex: hammerhead) to tag (ex: N5)
 codename_to_tag = {}
 
+# Build name, ex: "aosp_shamu-userdebug"
+aospbuild_re = re.compile(r"aosp_(\S+)\-\S+$")
+
 # Filter/munge recipe to smooth out gcc compilations
 flagmunge = """
 ifneq ($(my_clang),true)
@@ -177,89 +190,57 @@ def dochdir(thedir):
     u.error("chdir failed: %s" % err)
 
 
-def remove_from_file_if_present(mfile, todel):
-  """Remove specified line from makefile if present."""
-  if not os.path.exists(mfile):
-    u.error("bad entry in munge makefile table-- %s "
-            "does not appear to exist" % mfile)
-  mfile_new = "%s.munged" % mfile
-  found = False
-  u.verbose(2, "examining %s in remove munge" % mfile)
-  with open(mfile, "r") as rf:
-    with open(mfile_new, "w") as wf:
-      lines = rf.readlines()
-      linecount = 0
-      for line in lines:
-        linecount += 1
-        sline = line.strip()
-        if sline == todel:
-          found = True
-          u.verbose(2, "found todel %s at line %d "
-                    "in %s" % (todel, linecount, mfile))
-          continue
-        wf.write(line)
-  if found:
-    docmd("mv -f %s %s" % (mfile_new, mfile))
-    return True
-  return False
+def replace_file(newfile, oldfile):
+  """Move newfile into place as oldfile."""
+  if flag_echo:
+    sys.stderr.write("executing: mv -f %s %s\n" % (newfile, oldfile))
+  if flag_dryrun:
+    return
+  os.replace(newfile, oldfile)
 
 
-def append_to_file_if_not_already_present(mfile, toadd):
-  """Add specified line to makefile if not already present."""
-  if not os.path.exists(mfile):
-    u.error("bad entry in munge makefile table-- %s "
-            "does not appear to exist" % mfile)
-  mfile_new = "%s.munged" % mfile
-  u.verbose(2, "examining %s in append munge" % mfile)
-  with open(mfile, "r") as rf:
-    with open(mfile_new, "w") as wf:
-      lines = rf.readlines()
-      linecount = 0
-      for line in lines:
-        linecount += 1
-        sline = line.strip()
-        if sline == toadd:
-          u.verbose(2, "found toadd %s at line %d "
-                    "in %s" % (toadd, linecount, mfile))
-          return False
-        wf.write(line)
-      u.verbose(2, "appending toadd %s to %s "
-                "at line %d" % (toadd, mfile, linecount))
-      wf.write("%s\n" % toadd)
-  docmd("mv -f %s %s" % (mfile_new, mfile))
-  return True
+def remove_if_present(mfile, lines, todel):
+  """Remove specified line if present (returns None if not)."""
+  u.verbose(2, "examining %s in remove munge" % mfile)
+  newlines = [line for line in lines if line.strip() != todel]
+  if len(newlines) == len(lines):
+    return None
+  u.verbose(2, "found todel %s in %s" % (todel, mfile))
+  return newlines
 
 
-def insert_before_if_not_already_present(mfile, insertloc, keyword, toadd):
-  """Insert specified chunk of text to makefile if not already present."""
-  if not os.path.exists(mfile):
-    u.error("bad entry in munge makefile table-- %s "
-            "does not appear to exist" % mfile)
-  mfile_new = "%s.munged" % mfile
+def append_if_not_already_present(mfile, lines, toadd):
+  """Add specified line if not already present (returns None if so)."""
+  u.verbose(2, "examining %s in append munge" % mfile)
+  for linecount, line in enumerate(lines, 1):
+    if line.strip() == toadd:
+      u.verbose(2, "found toadd %s at line %d "
+                "in %s" % (toadd, linecount, mfile))
+      return None
+  u.verbose(2, "appending toadd %s to %s "
+            "at line %d" % (toadd, mfile, len(lines)))
+  return lines + ["%s\n" % toadd]
+
+
+def insert_before_if_not_already_present(mfile, lines, insertloc,
+                                         keyword, toadd):
+  """Insert chunk of text if not already present (returns None if so)."""
   u.verbose(2, "examining %s in insert-before munge" % mfile)
-  with open(mfile, "r") as rf:
-    with open(mfile_new, "w") as wf:
-      lines = rf.readlines()
-      linecount = 0
-      for line in lines:
-        linecount += 1
-        # Already present?
-        linewords = line.split()
-        for word in linewords:
-          if word == keyword:
-            u.verbose(2, "found keyword %s at line %d "
-                      "in %s" % (keyword, linecount, mfile))
-            return False
-        # At insertloc?
-        if line.strip() == insertloc:
-          u.verbose(2, "adding %s insert-before text at line %d "
-                    "in %s " % (keyword, linecount, mfile))
-          wf.write("%s\n" % toadd)
-          wf.write(line)
-        else:
-          wf.write(line)
-  docmd("mv -f %s %s" % (mfile_new, mfile))
-  return True
+  newlines = []
+  for linecount, line in enumerate(lines, 1):
+    # Already present? (substring test first, since it is cheap
+    # and almost always fails)
+    if keyword in line and keyword in line.split():
+      u.verbose(2, "found keyword %s at line %d "
+                "in %s" % (keyword, linecount, mfile))
+      return None
+    # At insertloc?
+    if line.strip() == insertloc:
+      u.verbose(2, "adding %s insert-before text at line %d "
+                "in %s " % (keyword, linecount, mfile))
+      newlines.append("%s\n" % toadd)
+    newlines.append(line)
+  return newlines
 
 
 def restore_single_makefile(mfile):
@@ -276,29 +257,40 @@ def restore_single_makefile(mfile):
 
 
 def munge_single_makefile(mfile, operations):
-  """Modify a single makefile."""
+  """Modify a single makefile.
+
+  All operations are applied to an in-memory copy of the makefile,
+  which is then written back (once) if anything changed.
+  """
   u.verbose(1, "examining makefile %s for munge" % mfile)
+  if not os.path.exists(mfile):
+    u.error("bad entry in munge makefile table-- %s "
+            "does not appear to exist" % mfile)
+  with open(mfile, "r") as rf:
+    lines = rf.readlines()
+  changed = False
   for tup in operations:
     opname = tup[0]
     item = tup[1]
     if opname == "remove":
-      was_present = remove_from_file_if_present(mfile, item)
-      if not was_present:
-        u.verbose(1, "bailing out early for makefile %s" % mfile)
-        break
+      newlines = remove_if_present(mfile, lines, item)
     elif opname == "append":
-      already_there = append_to_file_if_not_already_present(mfile, item)
-      if not already_there:
-        u.verbose(1, "bailing out early for makefile %s" % mfile)
-        break
+      newlines = append_if_not_already_present(mfile, lines, item)
     elif opname == "insert-before":
-      already_there = insert_before_if_not_already_present(mfile, item,
-                                                           tup[2], tup[3])
-      if not already_there:
-        u.verbose(1, "bailing out early for makefile %s" % mfile)
-        break
+      newlines = insert_before_if_not_already_present(mfile, lines, item,
+                                                      tup[2], tup[3])
     else:
       u.error("internal error -- unknown munge op %s" % opname)
+    if newlines is None:
+      u.verbose(1, "bailing out early for makefile %s" % mfile)
+      break
+    lines = newlines
+    changed = True
+  if changed:
+    mfile_new = "%s.munged" % mfile
+    with open(mfile_new, "w") as wf:
+      wf.writelines(lines)
+    replace_file(mfile_new, mfile)
 
 
 def munge_makefiles_if_needed():
@@ -317,39 +309,34 @@ def munge_makefiles_if_needed():
 def load_environment(old_env, new_env):
   """Load up new copy of environment from a dict."""
   u.verbose(2, "load_environment invoked")
-  # Find new vars, modified vars, deleted vars
-  added_vars = {}
-  modified_vars = {}
-  deleted_vars = {}
-  for v in new_env:
-    if v not in old_env:
-      added_vars[v] = 1
+  # Apply new vars, modified vars, deleted vars. Note that updates to
+  # os.environ are passed through to putenv/unsetenv.
+  added_vars = []
+  modified_vars = []
+  deleted_vars = []
+  for v, setting in new_env.items():
+    oldsetting = old_env.get(v)
+    if oldsetting is None:
+      added_vars.append(v)
+    elif oldsetting != setting:
+      modified_vars.append(v)
     else:
-      if new_env[v] != old_env[v]:
-        modified_vars[v] = 1
+      continue
+    os.environ[v] = setting
   for v in old_env:
     if v not in new_env:
-      deleted_vars[v] = 1
-  u.verbose(2, "deleting vars: %s" % " ".join(sorted(deleted_vars.keys())))
-  for v in deleted_vars:
-
-    os.unsetenv(v)
-    os.environ.pop(v, None)
-  u.verbose(2, "adding vars: %s" % " ".join(sorted(added_vars.keys())))
-  for v in added_vars:
-    os.putenv(v, new_env[v])
-    os.environ[v] = new_env[v]
-  u.verbose(2, "modifying vars: %s" % " ".join(sorted(modified_vars.keys())))
-  for v in modified_vars:
-    os.putenv(v, new_env[v])
-    os.environ[v] = new_env[v]
+      deleted_vars.append(v)
+      os.environ.pop(v, None)
+  u.verbose(2, "deleted vars: %s" % " ".join(sorted(deleted_vars)))
+  u.verbose(2, "added vars: %s" % " ".join(sorted(added_vars)))
+  u.verbose(2, "modified vars: %s" % " ".join(sorted(modified_vars)))
 
 
 def save_environment():
   """Save a copy of environment."""
   global saved_env
   u.verbose(1, "saving copy of environment")
-  saved_env = copy.deepcopy(os.environ)
+  saved_env = dict(os.environ)
 
 
 def read_env_cachefile(cachefile):
@@ -359,15 +346,11 @@ def read_env_cachefile(cachefile):
   env_dict = {}
   try:
     with open(cachefile, "r") as rf:
-      regex = re.compile(r"^([^=]+)\=(.*)$")
-      lines = rf.readlines()
-      for line in lines:
-        m = regex.match(line)
-        if not m:
+      for line in rf:
+        varname, sep, setting = line.rstrip("\n").partition("=")
+        if not sep or not varname:
           u.warning("unable to parse environment line %s" % line)
           continue
-        varname = m.group(1)
-        setting = m.group(2)
         u.verbose(2, "caching %s=%s" % (varname, setting))
         env_dict[varname] = setting
   except IOError:
@@ -377,36 +360,43 @@ def read_env_cachefile(cachefile):
 
 def capture_env_from_cmds(cmds, cachefile, errfile):
   """Capture the environment resulting from executing bash cmds."""
-  # Emit small bash script to execute
-  cmdfile = ".bashcmd"
-  with open(cmdfile, "w") as wf:
-    first = True
-    for c in cmds:
-      if first:
-        first = False
-        wf.write("%s 1> %s 2>&1\n" % (c, errfile))
-      else:
-        wf.write("%s 1>> %s 2>&1\n" % (c, errfile))
-      wf.write("if [ $? != 0 ]; then\n")
-      wf.write("  exit 1\n")
-      wf.write("fi\n")
-    wf.write("printenv > %s\n" % cachefile)
-    wf.write("exit 0\n")
-    wf.close()
-    rc = u.docmdnf("bash %s" % cmdfile)
-    if rc != 0:
-      u.warning("bash cmd failed")
-      u.warning("cmd script was:")
-      u.docmd("cat %s" % cmdfile)
-      u.warning("bash error output was:")
-      u.docmd("cat %s" % errfile)
-      raise Exception("command failed")
+  # Run cmds in sequence (stopping at first failure) in a single bash
+  # invocation, then dump out the resulting environment.
+  script = " && ".join(cmds + ["printenv > %s" % cachefile])
+  with open(errfile, "w") as ef:
+    rc = subprocess.call(["bash", "-c", script],
+                         stdout=ef, stderr=subprocess.STDOUT)
+  if rc != 0:
+    u.warning("bash cmd failed")
+    u.warning("cmd script was: %s" % script)
+    u.warning("bash error output was:")
+    u.docmd("cat %s" % errfile)
+    raise Exception("command failed")
+
+
+def lunch_cache_key(abuild):
+  """Return key for cached results of lunch for specific target.
+
+  Lunch results depend on the tree location, on $OUT_DIR and on
+  envsetup.sh, so these are folded into the key; an edited (or synced)
+  envsetup.sh results in a fresh lunch.
+  """
+  h = hashlib.sha1()
+  h.update(os.getcwd().encode())
+  h.update(os.environ.get("OUT_DIR", "").encode())
+  try:
+    with open("build/envsetup.sh", "rb") as rf:
+      h.update(rf.read())
+  except IOError as err:
+    u.error("unable to read build/envsetup.sh: %s" % err)
+  h.update(abuild.encode())
+  return h.hexdigest()[:16]
 
 
 def simulate_lunch(abuild):
   """Simulate lunch command for specific target."""
   # If we have previously cached results, read them
-  cachefile = ".lunch.%s.txt" % abuild
+  cachefile = ".lunch.%s.%s.txt" % (abuild, lunch_cache_key(abuild))
   errfile = ".basherr.%s.txt" % abuild
   if not os.path.exists(cachefile):
     cmds = [". build/envsetup.sh", "lunch %s" % abuild]
@@ -480,8 +470,7 @@ def read_device_info():
 
 def get_device_tag_from_build(abuild):
   """Map build name (ex: aosp_hammerhead-userdebug) to tag (ex: N5)."""
-  regex = re.compile(r"aosp_(\S+)\-\S+$")
-  m = regex.match(abuild)
+  m = aospbuild_re.match(abuild)
   if not m:
     u.warning("unable to flash build %s (can't derive "
               "device codename" % abuild)
@@ -498,14 +487,12 @@ def get_device_tag_from_build(abuild):
 def device_is_online(tag):
   """See if device online."""
   lines = u.docmdlines("showdevices.py")
-  regex = re.compile(r"\s*(\S+)\s+(\S+)\s+(\S+)\s*$")
   for line in lines:
-    m = regex.match(line)
-    if not m:
+    # Expect three fields: tag, serial, status
+    fields = line.split()
+    if len(fields) != 3:
       continue
-    dtag = m.group(1)
-    dserial = m.group(2)
-    dstat = m.group(3)
+    dtag, dserial, dstat = fields
     if dtag == tag and dstat == "device":
       u.verbose(1, "device %s online with serial %s" % (dtag, dserial))
       return dserial
@@ -536,12 +523,9 @@ def perform_flash(abuild):
 
 def collect_propval(propname, serial):
   """Collect value for a given system property."""
-  lines = u.docmdlines("adb -s %s shell getprop" % serial)
-  regex = re.compile(r"\[(\S+)\]\:\s+\[(.+)\]\s*$")
-  for line in lines:
-    m = regex.match(line)
-    if m and m.group(1) == propname:
-      return m.group(2)
+  lines = u.docmdlines("adb -s %s shell getprop %s" % (serial, propname))
+  if lines and lines[0].strip():
+    return lines[0].strip()
   return None
 
 
@@ -561,17 +545,21 @@ def perform_verify(abuild, serial):
   u.verbose(1, "adb wait-for-device took %d seconds" % delta)
 
   # Wait for the boot animation to complete. Allow three minutes here.
-  for ii in range(20):
-    u.verbose(1, "checking for boot animation iter %d" % ii)
-    val = collect_propval("init.svc.bootanim", serial)
-    if not val or val == "running":
-      u.verbose(1, "boot animation still running, waiting...")
-      if val:
-        u.verbose(1, "returned value was %s" % val)
-      time.sleep(10)
-    else:
-      u.verbose(1, "boot animation complete")
-      break
+  # Polling is done on the device side, as opposed to issuing a new
+  # adb command every few seconds.
+  u.verbose(1, "waiting for boot animation to complete")
+  rc = u.docmdwithtimeout("adb -s %s shell 'while [ -z \"$(getprop "
+                          "init.svc.bootanim)\" -o \"$(getprop "
+                          "init.svc.bootanim)\" = running ]; "
+                          "do sleep 1; done'" % serial, 200)
+  if rc == -1:
+    u.verbose(1, "boot animation still running after timeout")
+  elif rc != 0:
+    u.verbose(0, "adb shell failed (rc=%d) while waiting for boot "
+              "animation after flashing build '%s'" % (rc, abuild))
+    return
+  else:
+    u.verbose(1, "boot animation complete")
 
   val = collect_propval("sys.boot_completed", serial)
   u.verbose(1, "sys.boot_completed is now '%s'" % val)
@@ -585,44 +573,107 @@ def perform_verify(abuild, serial):
 
 
 def summarize_dwarf(abuild):
-  """Produce a report on dwarf producer."""
+  """Produce a report on dwarf producer.
+
+  A manifest of the files examined (with mtimes and sizes) is kept
+  alongside the report; if nothing has changed since the report was
+  last produced, it is left as is.
+  """
   apo = os.environ["ANDROID_PRODUCT_OUT"]
   if not apo:
     u.error("internal error -- no ANDROID_PRODUCT_OUT env setting")
   symsdir = "%s/symbols" % apo
   if os.path.exists(symsdir):
-    lines = u.docmdlines("find %s -type f -print" % symsdir)
-    slines = []
-    for line in lines:
-      slines.append(line.strip())
-    if slines:
+    manifest = {}
+    for path in u.find_files(symsdir):
+      st = os.lstat(path)
+      manifest[path] = [st.st_mtime_ns, st.st_size]
+    if manifest:
       outfile = "llvm-dwflavor-report.%s.txt" % abuild
-      cmd = "llvm-dwflavor %s" % " ".join(slines)
+      manfile = "llvm-dwflavor-report.%s.manifest" % abuild
+      if os.path.exists(outfile) and os.path.exists(manfile):
+        try:
+          with open(manfile, "r") as rf:
+            if json.load(rf) == manifest:
+              u.verbose(1, "%s is up to date" % outfile)
+              return
+        except (IOError, ValueError):
+          pass
+      args = ["llvm-dwflavor", "-show-comp-units"] + list(manifest)
       if flag_dryrun:
-        u.verbose(1, "cmd: %s > %s" % (cmd, outfile))
-      else:
-        u.docmdout("llvm-dwflavor -show-comp-units "
-                   "%s" % " ".join(slines), outfile, True)
+        u.verbose(1, "cmd: %s > %s" % (" ".join(args), outfile))
+        return
+      with open(outfile, "w") as wf:
+        rc = subprocess.call(args, stdout=wf)
+      if rc != 0:
+        u.warning("error: command failed (rc=%d) cmd: "
+                  "llvm-dwflavor ... > %s" % (rc, outfile))
+        return
+      with open(manfile, "w") as wf:
+        json.dump(manifest, wf)
   else:
     u.verbose(1, "DWARF flavor report stubbed "
               "out -- %s doesn't exist" % symsdir)
 
 
+def move_to_trash(path):
+  """Rename directory tree out of the way, returning its new path.
+
+  As far as subsequent builds are concerned the tree is gone right
+  away; removing it is left to remove_in_background. Returns None if
+  there was nothing left to remove.
+  """
+  if not os.path.exists(path):
+    return None
+  # Unique name, since removal of an earlier trash dir for the same
+  # path may still be in progress. The (empty) placeholder directory
+  # created here is replaced by the rename.
+  trash = tempfile.mkdtemp(prefix="%s.trash." % os.path.basename(path),
+                           dir=os.path.dirname(path) or ".")
+  try:
+    os.rename(path, trash)
+  except OSError as err:
+    u.verbose(1, "rename of %s failed (%s), removing in place" % (path, err))
+    os.rmdir(trash)
+    shutil.rmtree(path, ignore_errors=True)
+    return None
+  return trash
+
+
+def remove_in_background(trash):
+  """Remove directory tree without waiting for the removal to finish."""
+  pending_removals.append(subprocess.Popen(["rm", "-rf", trash],
+                                           start_new_session=True))
+
+
 def perform_build(abuild):
-  """Run a single specified build."""
+  """Run a single specified build.
+
+  Returns a (status, trash) pair, where trash is the moved-aside
+  product out dir still to be removed (or None).
+  """
   u.verbose(1, "running build: %s" % abuild)
+  if flag_concurrent_builds > 1:
+    # Concurrent builds can't share an out dir (host tools, soong and
+    # ninja state live there too), so each target gets its own.
+    outdir = "%s.%s" % (saved_env.get("OUT_DIR", "out"), abuild)
+    u.verbose(1, "using OUT_DIR %s for %s" % (outdir, abuild))
+    os.environ["OUT_DIR"] = outdir
   lunched_env = simulate_lunch(abuild)
   outfile = "build-err.%s.txt" % abuild
   cbf = "-t"
   if flag_checkbuild:
     cbf = "-T"
+  # Concurrent builds split the parallel factor between them
+  parfactor = max(1, flag_parfactor // flag_concurrent_builds)
   if flag_mmma_target:
-    bcmd = "mmm.py -k -j %d -a %s" % (flag_parfactor, flag_mmma_target)
+    bcmd = "mmm.py -k -j %d -a %s" % (parfactor, flag_mmma_target)
   else:
-    bcmd = "mmm.py -k -j %d %s" % (flag_parfactor, cbf)
+    bcmd = "mmm.py -k -j %d %s" % (parfactor, cbf)
   if flag_dryrun:
     bcmd = "echo %s" % bcmd
   rc = 0
+  trash = None
   if flag_do_build:
     u.verbose(1, "kicking off build cmd %s for %s" % (bcmd, abuild))
     rc = u.docmderrout(bcmd, outfile, nf=True)
@@ -642,7 +693,7 @@ def perform_build(abuild):
       u.error("internal error -- no ANDROID_PRODUCT_OUT env setting")
     u.verbose(1, "cleaning %s" % apo)
     if not flag_dryrun:
-      shutil.rmtree(apo, ignore_errors=True)
+      trash = move_to_trash(apo)
     else:
       u.verbose(0, "rm -rf %s" % apo)
   else:
@@ -654,7 +705,46 @@ def perform_build(abuild):
       perform_verify(abuild, serial)
   # restore env
   load_environment(lunched_env, saved_env)
-  return rc
+  return rc, trash
+
+
+def start_build(abuild):
+  """Kick off build for specified target, returning (status, trash)."""
+  u.verbose(0, "starting build for '%s'" % abuild)
+  if flag_concurrent_builds == 1:
+    return perform_build(abuild)
+  # Running in a pool worker: don't let u.error() or a failed lunch
+  # take down the worker (and the rest of the run with it), report a
+  # failed build instead.
+  try:
+    return perform_build(abuild)
+  except SystemExit:
+    u.warning("build for '%s' exited early" % abuild)
+  except Exception as err:
+    u.warning("build for '%s' failed: %s" % (abuild, err))
+  # Don't leave a partly lunched environment to the worker's next build
+  load_environment(dict(os.environ), saved_env)
+  return 1, None
+
+
+def collect_results(allbuilds, results):
+  """Sort builds into passed/failed, starting removal of their out dirs.
+
+  The removals are started here, in the main process, so that they
+  can be waited for even when the builds ran in pool workers.
+  """
+  passed = []
+  failed = []
+  for build_item, (rc, trash) in zip(allbuilds, results):
+    if trash:
+      remove_in_background(trash)
+    if rc != 0:
+      if flag_exit_on_err:
+        u.verbose(0, "early exit due to build failure")
+      failed.append(build_item)
+    else:
+      passed.append(build_item)
+  return passed, failed
 
 
 def perform():
@@ -669,17 +759,23 @@ def perform():
       if val:
         builds.append(abuild)
     allbuilds = sorted(builds)
-  passed = []
-  failed = []
-  for build_item in allbuilds:
-    u.verbose(0, "starting build for '%s'" % build_item)
-    rc = perform_build(build_item)
-    if rc != 0:
-      if flag_exit_on_err:
-        u.verbose(0, "early exit due to build failure")
-      failed.append(build_item)
-    else:
-      passed.append(build_item)
+  if flag_concurrent_builds > 1:
+    # Each target builds into its own $OUT_DIR (see perform_build), and
+    # each worker process gets its own copy of the (lunched) environment.
+    sys.stdout.flush()
+    sys.stderr.flush()
+    ctx = multiprocessing.get_context("fork")
+    # Workers are all forked up front; forking new ones later on could
+    # hand them the pipes of in-flight "rm -rf" launches and hang those.
+    with ctx.Pool(processes=flag_concurrent_builds) as pool:
+      passed, failed = collect_results(allbuilds,
+                                       pool.imap(start_build, allbuilds))
+  else:
+    passed, failed = collect_results(allbuilds, map(start_build, allbuilds))
+  if pending_removals:
+    u.verbose(0, "waiting for cleanup of build output dirs")
+    for p in pending_removals:
+      p.wait()
   print("Summary of results:")
   if passed:
     print("passed: %s" % " ".join(passed))
@@ -705,6 +801,8 @@ def usage(msgarg):
     -a X   invoke equivalent of 'mmma X' instead of full build
     -x     exit on first build failure
     -j N   set parallel build factor to N (default: 40)
+    -P K   run up to K builds at once; each gets 1/K of the -j factor
+           and builds into its own out dir (ex: out.aosp_x86-eng)
     -S T   build for single target T or list of comma-separated targets
     -M     don't munge build/core/envsetup.mk to default to gcc before build
     -E     early exit after makefile munge (debugging)
@@ -745,10 +843,10 @@ def parse_args():
   global flag_echo, flag_dryrun, flag_mmma_target, flag_parfactor
   global flag_exit_on_err, flag_do_flash, flag_do_build, flag_do_clean
   global flag_targets, flag_do_flashverify, flag_munge_make
-  global flag_postmunge_exit, flag_checkbuild
+  global flag_postmunge_exit, flag_checkbuild, flag_concurrent_builds
 
   try:
-    optlist, args = getopt.getopt(sys.argv[1:], "da:j:xeDBCEFMVZS:")
+    optlist, args = getopt.getopt(sys.argv[1:], "da:j:xeDBCEFMP:VZS:")
   except getopt.GetoptError as err:
     # unrecognized option
     usage(str(err))
@@ -765,6 +863,10 @@ def parse_args():
       flag_mmma_target = arg
     elif opt == "-j":
       flag_parfactor = int(arg)
+    elif opt == "-P":
+      flag_concurrent_builds = int(arg)
+      if flag_concurrent_builds < 1:
+        usage("argument to -P option must be positive")
     elif opt == "-S":
       if flag_targets:
         usage("supply single instance of -S option")
@@ -148,6 +148,23 @@ def docmderrout(cmd, outfile, nf=None):
   return 1
 
 
+# invoke command, appending output to an already open file
+def docmdtofile(cmd, outf, nf=None):
+  """Run a command via subprocess, appending output to open file object."""
+  verbose(2, "+ docmdtofile executing: %s > %s" % (cmd, outf.name))
+  args = shlex.split(cmd)
+  # Flush anything buffered on our side so that it lands before the
+  # command output.
+  outf.flush()
+  rc = subprocess.call(args, stdout=outf)
+  if rc != 0:
+    warning("error: command failed (rc=%d) cmd: %s" % (rc, cmd))
+    if nf:
+      return None
+    error("")
+  return True
+
+
 # invoke command, reading from one file and writing to another
 def docmdinout(cmd, infile, outfile):
   """Run a command via subprocess with input and output file."""
@@ -274,6 +291,16 @@ def determine_btrfs_ssdroot(here):
   return root
 
 
+def find_files(subdir):
+  """Yield paths of regular files below subdir, like 'find -type f'."""
+  with os.scandir(subdir) as it:
+    for entry in it:
+      if entry.is_dir(follow_symlinks=False):
+        yield from find_files(entry.path)
+      elif entry.is_file(follow_symlinks=False):
+        yield entry.path
+
+
 def hr_size_to_bytes(sz):
   """Convert human readable size back to bytes."""
   m = hrszre.match(sz)
@@ -3,6 +3,7 @@
 
 """
 
+import os
 import tempfile
 import unittest
 import sys
@@ -60,6 +61,27 @@ class TestScriptUtilsMethods(unittest.TestCase):
     val = u.docmdout("/bin/false", "/dev/null", True)
     self.assertTrue(val == None)
 
+  def test_docmdtofile_pass(self):
+    outf = tempfile.NamedTemporaryFile(mode="w", delete=True)
+    outf.write("first\n")
+    u.docmdtofile("expr 2 + 5", outf)
+    outf.flush()
+    verif = open(outf.name, "r")
+    lines = verif.readlines()
+    verif.close()
+    self.assertTrue(lines[0].strip() == "first")
+    self.assertTrue(lines[1].strip() == "7")
+
+  def test_docmdtofile_fail(self):
+    with self.assertRaises(Exception):
+      outf = tempfile.NamedTemporaryFile(mode="w", delete=True)
+      u.docmdtofile("date -XYZ", outf)
+
+  def test_docmdtofile_nf(self):
+    outf = tempfile.NamedTemporaryFile(mode="w", delete=True)
+    val = u.docmdtofile("/bin/false", outf, True)
+    self.assertTrue(val == None)
+
   def test_docmdinout_pass(self):
     outf = tempfile.NamedTemporaryFile(mode="w", delete=True)
     inf = tempfile.NamedTemporaryFile(mode="w", delete=True)
@@ -131,6 +153,17 @@ class TestScriptUtilsMethods(unittest.TestCase):
     with self.assertRaises(Exception):
       _ = u.determine_btrfs_ssdroot("/tmp")
 
+  def test_find_files(self):
+    u.increment_verbosity()
+    with tempfile.TemporaryDirectory() as tdir:
+      os.makedirs(os.path.join(tdir, "a", "b"))
+      for f in ["x", "a/y", "a/b/z"]:
+        with open(os.path.join(tdir, f), "w") as wf:
+          wf.write("foo\n")
+      os.symlink("a", os.path.join(tdir, "link"))
+      found = sorted(os.path.relpath(p, tdir) for p in u.find_files(tdir))
+      self.assertEqual(found, ["a/b/z", "a/y", "x"])
+
   def test_hr_size_convert(self):
     u.increment_verbosity()
     b1 = u.hr_size_to_bytes("1G")